@@ -1,21 +1,31 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Generator, Optional, AsyncGenerator
+from typing import Dict, Any, List, Generator, Iterator, Optional, AsyncGenerator
 import uvicorn
 import logging
-import json
+import orjson
 import asyncio
+import functools
+import time
 import uuid
-from datetime import datetime
-from multi_agent_system import run_multi_agent_query_stream, EXPERT_DEFINITIONS, MessageInput
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from multi_agent_system import run_multi_agent_query_stream_async, aclose_shared_http_clients, EXPERT_DEFINITIONS, MessageInput
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, BaseMessage
+from pathlib import Path
+from types import MappingProxyType
 import os
+import sys
 
 # Configure logging
+# LOG_LEVEL=WARNING silences per-request INFO logging under load
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
 logging.basicConfig(
-    level=logging.INFO,  # Set to INFO level
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
@@ -26,9 +36,9 @@ logging.getLogger("openai").setLevel(logging.WARNING)  # Disable OpenAI verbose
 logging.getLogger("openai._base_client").setLevel(logging.WARNING)  # Disable OpenAI base client DEBUG logs
 logging.getLogger("uvicorn.access").setLevel(logging.WARNING)  # Reduce uvicorn access logs
 
-# Keep our own loggers at INFO level
-logging.getLogger("api_server").setLevel(logging.INFO)
-logging.getLogger("multi_agent_system").setLevel(logging.INFO)
+# Our own loggers follow LOG_LEVEL (INFO by default)
+logging.getLogger("api_server").setLevel(LOG_LEVEL)
+logging.getLogger("multi_agent_system").setLevel(LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
 
@@ -53,30 +63,117 @@ class ChatSession:
         self.prompts: Dict[str, List[Dict[str, Any]]] = {}
         # tool call ID mapping for consistency
         self.tool_call_ids: Dict[str, str] = {}
+        self._tool_counter = 0
         self.created_at = datetime.now()
-        self.last_activity = datetime.now()
+        # monotonic seconds, only used for idle-time eviction
+        self.last_activity = time.monotonic()
+        # serialized form of self.messages, kept in step by add_message
+        self._serialized: List[Dict[str, Any]] = []
+
+    def add_message(self, msg: BaseMessage):
+        self.messages.append(msg)
+        self._serialized.append(msg.model_dump(mode="python", exclude_none=True))
     
+    def next_tool_call_id(self) -> str:
+        # Only needs to be unique within the session, so skip uuid4
+        self._tool_counter += 1
+        return f"{self.session_id[:8]}-{self._tool_counter}"
+
     def get_messages(self) -> List[Dict[str, Any]]:
         # Only return clean messages (no prompt) for next model call
-        return [msg.dict() for msg in self.messages]
+        return list(self._serialized)
+
+# In-memory session storage, bounded by count (LRU) and idle time (TTL)
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_SWEEP_INTERVAL_SECONDS = 60
+sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
 
-# In-memory session storage
-sessions: Dict[str, ChatSession] = {}
+def _is_session_expired(session: ChatSession) -> bool:
+    return time.monotonic() - session.last_activity > SESSION_TTL_SECONDS
+
+def evict_expired_sessions() -> int:
+    """Drop sessions idle for longer than SESSION_TTL_SECONDS. Returns the number evicted."""
+    expired = [sid for sid, s in sessions.items() if _is_session_expired(s)]
+    for sid in expired:
+        del sessions[sid]
+    return len(expired)
 
 def get_or_create_session(session_id: Optional[str] = None) -> ChatSession:
     if session_id and session_id in sessions:
-        return sessions[session_id]
+        session = sessions[session_id]
+        if not _is_session_expired(session):
+            session.last_activity = time.monotonic()
+            sessions.move_to_end(session_id)
+            return session
+        del sessions[session_id]
     new_session_id = str(uuid.uuid4())
     session = ChatSession(new_session_id)
     sessions[new_session_id] = session
-    logger.info(f"Created new session: {new_session_id}")
+    # Evict least recently used sessions beyond the limit
+    while len(sessions) > MAX_SESSIONS:
+        sessions.popitem(last=False)
+    logger.info("Created new session: %s", new_session_id)
     return session
 
+async def _sweep_sessions_periodically():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+        evicted = evict_expired_sessions()
+        if evicted:
+            logger.info("Evicted %d expired sessions (%d active)", evicted, len(sessions))
+
+# Converting streamed events back into session history
+def _save_agent_message(session: ChatSession, m: Dict[str, Any]):
+    session.add_message(AIMessage(content=m.get("content", "")))
+    if m.get("prompt"):
+        session.prompts[m["id"]] = m["prompt"]
+
+def _save_tool_call_message(session: ChatSession, m: Dict[str, Any]):
+    # Represent as AIMessage with tool_calls
+    prompt = m.get("prompt")
+    tool_call_id = session.next_tool_call_id()  # Generate a consistent ID
+    # Save original content to session (empty string for tool calls)
+    session.add_message(
+        AIMessage(content="", tool_calls=[{
+            "id": tool_call_id,
+            "name": m.get("tool_name"),
+            "args": m.get("tool_args", {})
+        }])
+    )
+    if prompt:
+        session.prompts[m["id"]] = prompt
+    # Store the tool call ID for later use
+    session.tool_call_ids[m.get("tool_name")] = tool_call_id
+
+def _save_tool_result_message(session: ChatSession, m: Dict[str, Any]):
+    # Use the stored tool call ID
+    tool_call_id = session.tool_call_ids.get(m.get("tool_name")) or session.next_tool_call_id()
+    session.add_message(
+        ToolMessage(content=m.get("content", ""), tool_call_id=tool_call_id)
+    )
+
+_SESSION_MESSAGE_HANDLERS = MappingProxyType({
+    "agent": _save_agent_message,
+    "tool_call": _save_tool_call_message,
+    "tool_result": _save_tool_result_message,
+})
+
+def save_event_to_session(session: ChatSession, ev: Dict[str, Any]):
+    """Convert SSE event into BaseMessage and append to session."""
+    if ev.get("type") != "message":
+        return
+    m = ev.get("message", {})
+    handler = _SESSION_MESSAGE_HANDLERS.get(m.get("type"))
+    if handler:
+        handler(session, m)
+
 # Request/Response Models
 class StreamQueryRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
     model: Optional[str] = None  # Allow frontend to configure model
+    batch_events: bool = False  # Client understands "messages_batch" events
 
 class ModelConfigRequest(BaseModel):
     model: str
@@ -86,8 +183,9 @@ class ModelListResponse(BaseModel):
     default_model: str
 
 # Available models configuration
+@functools.lru_cache(maxsize=1)
 def get_available_models():
-    """Load available models list from environment variables"""
+    """Load available models list from environment variables (parsed once per process)"""
     # Read models list from environment variable
     models_str = os.getenv("AVAILABLE_MODELS", "openai/gpt-4o,openai/gpt-4o-mini,anthropic/claude-sonnet-4")
     model_ids = [model.strip() for model in models_str.split(",")]
@@ -113,131 +211,120 @@ def get_available_models():
 
 DEFAULT_MODEL = os.getenv("LLM_MODEL", "openai/gpt-4o")
 
+# Tool execution and file reads run on the default executor, shared by all streams
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "128"))
+
+@app.on_event("startup")
+async def configure_default_executor():
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="agent-producer")
+    )
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    app.state.session_sweeper = asyncio.create_task(_sweep_sessions_periodically())
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    app.state.session_sweeper.cancel()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    # The pooled LLM connections were opened on this server's event loop
+    await aclose_shared_http_clients()
+
 # API Endpoints
 @app.get("/")
 async def root():
     return {"message": "Multi-Agent Expert System API"}
 
-@app.get("/models")
-async def get_available_models_endpoint():
-    """Get list of available models for frontend configuration"""
+@functools.lru_cache(maxsize=1)
+def _get_model_list_response() -> ModelListResponse:
     return ModelListResponse(
         models=get_available_models(),
         default_model=DEFAULT_MODEL
     )
 
-@app.post("/chat/stream")
-async def chat_stream_endpoint(request: StreamQueryRequest):
-    """
-    The single endpoint for all chat interactions.
-    Streams execution steps and uses session-based history.
-    """
+@app.get("/models")
+async def get_available_models_endpoint():
+    """Get list of available models for frontend configuration"""
+    return _get_model_list_response()
+
+# SSE framing, pre-encoded so frames are yielded as bytes
+SSE_DATA_PREFIX = b"data: "
+SSE_FRAME_END = b"\n\n"
+NDJSON_LINE_END = b"\n"
+
+def _start_session_query(request: StreamQueryRequest) -> tuple[ChatSession, str]:
+    """Validate a chat request and add its message to the session history."""
     if not request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
-    # Set model if specified by frontend
-    if request.model:
-        os.environ["LLM_MODEL"] = request.model
-        logger.info(f"Using model: {request.model}")
-    else:
-        # Use default model
-        current_model = os.getenv("LLM_MODEL", DEFAULT_MODEL)
-        logger.info(f"Using default model: {current_model}")
+    # Use the model specified by frontend for this request only
+    model = request.model or DEFAULT_MODEL
+    logger.info("Using model: %s", model)
 
     session = get_or_create_session(request.session_id)
     # Save human message to session history
-    session.messages.append(HumanMessage(content=request.message))
-    
-    logger.info(f"Session {session.session_id}: Received query '{request.message}' (History: {len(session.messages)} msgs)")
+    session.add_message(HumanMessage(content=request.message))
     
-    def _save_event_to_session(ev: Dict[str, Any]):
-        """Convert SSE event into BaseMessage and append to session."""
-        if ev.get("type") != "message":
-            return
-        m = ev.get("message", {})
-        m_type = m.get("type")
-        if m_type == "agent":
-            session.messages.append(AIMessage(content=m.get("content", "")))
-        elif m_type == "tool_call":
-            # Represent as AIMessage with tool_calls
-            prompt = m.get("prompt")
-            tool_call_id = str(uuid.uuid4())  # Generate a consistent ID
-            # Save original content to session (empty string for tool calls)
-            session.messages.append(
-                AIMessage(content="", tool_calls=[{
-                    "id": tool_call_id,
-                    "name": m.get("tool_name"),
-                    "args": m.get("tool_args", {})
-                }])
-            )
-            if prompt:
-                session.prompts[m["id"]] = prompt
-            # Store the tool call ID for later use
-            session.tool_call_ids[m.get("tool_name")] = tool_call_id
-        elif m_type == "tool_result":
-            # Use the stored tool call ID
-            tool_call_id = session.tool_call_ids.get(m.get("tool_name"), str(uuid.uuid4()))
-            session.messages.append(
-                ToolMessage(content=m.get("content", ""), tool_call_id=tool_call_id)
-            )
-        
-        # Save prompt for agent messages
-        if m_type == "agent" and m.get("prompt"):
-            session.prompts[m["id"]] = m["prompt"]
-
-    async def stream_generator() -> AsyncGenerator[str, None]:
-        queue = asyncio.Queue()
-
-        def producer():
-            """Runs the sync agent code and puts events into the queue."""
-            try:
-                # The agent system is now the source of truth for message history
-                for event in run_multi_agent_query_stream(session.get_messages()):
-                    queue.put_nowait(event)
-            except Exception as e:
-                # Put exception in queue to be raised in the main thread
-                queue.put_nowait(e)
-            finally:
-                # Use a sentinel value to signal completion
-                queue.put_nowait(None)
-        
-        # Run the synchronous generator in a separate thread
-        loop = asyncio.get_event_loop()
-        producer_task = loop.run_in_executor(None, producer)
-
-        try:
-            while True:
-                # Wait for an event from the producer thread
-                event = await queue.get()
-
-                # Check for sentinel value or exception
-                if event is None:
-                    break
-                if isinstance(event, Exception):
-                    raise event
-
-                event["session_id"] = session.session_id
-                event_json = json.dumps(event)
-                logger.info(f"📤 Sending event: {event.get('type', 'unknown')} - {event_json[:100]}...")
-                _save_event_to_session(event)
-                yield f"data: {event_json}\n\n"
-        
-        except Exception as e:
-            logger.error(f"Error during stream for session {session.session_id}: {e}", exc_info=True)
-            error_event = {"type": "error", "error": str(e), "session_id": session.session_id}
-            yield f"data: {json.dumps(error_event)}\n\n"
-        
-        finally:
-            # Ensure producer task is cleaned up
-            if not producer_task.done():
-                producer_task.cancel()
-            logger.info(f"Session {session.session_id} stream completed.")
-            # Send a final "end" event to the client
-            end_event = {"type": "end", "session_id": session.session_id}
-            yield f"data: {json.dumps(end_event)}\n\n"
+    logger.info("Session %s: Received query '%s' (History: %d msgs)", session.session_id, request.message, len(session.messages))
+    return session, model
+
+async def _session_events(session: ChatSession, model: str, batch_events: bool) -> AsyncGenerator[Dict[str, Any], None]:
+    """Run the query on the session's history and save its events once the stream ends.
+
+    Ends with an "error" event if the run failed, then always an "end" event.
+    """
+    # Events are saved to the session once the stream ends, keeping the
+    # bookkeeping off the send path while preserving event order
+    pending_events: List[Dict[str, Any]] = []
+    try:
+        # The agent system is now the source of truth for message history
+        async for event in run_multi_agent_query_stream_async(
+            session.get_messages(), model=model, batch_tool_events=batch_events
+        ):
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📤 Sending event: %s", event.get("type", "unknown"))
+            # Token deltas are only for live display; the final message is saved instead
+            if event.get("type") != "token":
+                pending_events.append(event)
+            yield event
 
+    except Exception as e:
+        logger.error("Error during stream for session %s: %s", session.session_id, e, exc_info=True)
+        yield {"type": "error", "error": str(e), "session_id": session.session_id}
+
+    finally:
+        for event in pending_events:
+            save_event_to_session(session, event)
+        logger.info("Session %s stream completed.", session.session_id)
+
+    # Send a final "end" event to the client
+    yield {"type": "end", "session_id": session.session_id}
+
+async def _encode_events(events: AsyncGenerator[Dict[str, Any], None], session_id: str, frame_start: bytes, frame_end: bytes) -> AsyncGenerator[bytes, None]:
+    """Encode each event as one frame, with the session id added to every event."""
+    # session_id is constant for the stream, so splice it into the frame
+    # prefix once instead of inserting it into every event dict
+    prefixed_start = frame_start + b'{"session_id":' + orjson.dumps(session_id) + b','
+    async for event in events:
+        if "session_id" in event:
+            yield frame_start + orjson.dumps(event) + frame_end
+        else:
+            # Every event carries at least a "type" key, so the body after "{" is non-empty
+            yield prefixed_start + orjson.dumps(event)[1:] + frame_end
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: StreamQueryRequest):
+    """
+    The single endpoint for all chat interactions.
+    Streams execution steps and uses session-based history.
+    """
+    session, model = _start_session_query(request)
+    events = _session_events(session, model, request.batch_events)
     return StreamingResponse(
-        stream_generator(), 
+        _encode_events(events, session.session_id, SSE_DATA_PREFIX, SSE_FRAME_END),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -247,12 +334,26 @@ async def chat_stream_endpoint(request: StreamQueryRequest):
         }
     )
 
+@app.post("/chat/ndjson")
+async def chat_ndjson_endpoint(request: StreamQueryRequest):
+    """
+    Same stream and session handling as /chat/stream, as newline-delimited JSON
+    (one event per line) for clients that don't speak SSE.
+    """
+    session, model = _start_session_query(request)
+    events = _session_events(session, model, request.batch_events)
+    return StreamingResponse(
+        _encode_events(events, session.session_id, b"", NDJSON_LINE_END),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"},
+    )
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "version": "1.0.0",
         "service": "Multi-Agent Expert System API"
     }
@@ -261,106 +362,194 @@ async def health_check():
 async def get_experts():
     return {"experts": EXPERT_DEFINITIONS}
 
-@app.get("/file/view")
-async def view_file(file_path: str):
+# Index of file names under output/ so /file/view does not walk the tree per request
+FILE_INDEX_TTL_SECONDS = 30.0
+_file_index: Dict[str, Path] = {}
+_file_index_built_at = 0.0
+
+def _build_file_index(root: Path) -> Dict[str, Path]:
+    index: Dict[str, Path] = {}
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for name in filenames:
+            index.setdefault(name, Path(dirpath) / name)
+    return index
+
+def _find_in_output_dir(name: str) -> Optional[Path]:
+    """Look up a file name under output/, rebuilding the index when stale or on a miss."""
+    global _file_index, _file_index_built_at
+
+    output_dir = Path.cwd() / "output"
+    if not output_dir.exists():
+        return None
+
+    if time.monotonic() - _file_index_built_at > FILE_INDEX_TTL_SECONDS:
+        _file_index = _build_file_index(output_dir)
+        _file_index_built_at = time.monotonic()
+
+    path = _file_index.get(name)
+    if path is not None and path.is_file():
+        return path
+
+    # The file may have been created since the index was built
+    _file_index = _build_file_index(output_dir)
+    _file_index_built_at = time.monotonic()
+    return _file_index.get(name)
+
+# File extension -> syntax highlighting language for /file/view
+_LANGUAGE_MAP = MappingProxyType({
+    '.py': 'python',
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.jsx': 'jsx',
+    '.tsx': 'tsx',
+    '.html': 'html',
+    '.css': 'css',
+    '.json': 'json',
+    '.md': 'markdown',
+    '.yml': 'yaml',
+    '.yaml': 'yaml',
+    '.xml': 'xml',
+    '.sh': 'bash',
+    '.sql': 'sql',
+    '.txt': 'text'
+})
+
+@functools.lru_cache(maxsize=4)
+def _get_search_dirs(cwd: Path) -> tuple[Path, ...]:
+    """Directories /file/view is allowed to serve from, relative to the working directory."""
+    return (cwd, cwd / "output", cwd / "test_sandbox")
+
+@functools.lru_cache(maxsize=4)
+def _get_allowed_dirs_resolved(cwd: Path) -> tuple[Path, ...]:
+    return tuple(d.resolve() for d in _get_search_dirs(cwd))
+
+def _read_text_file(path: Path) -> str:
+    """Read a file once as bytes and decode as UTF-8, falling back to latin-1."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+def _count_lines(content: str) -> int:
+    """Count lines without materializing a list like splitlines() does."""
+    if not content:
+        return 0
+    return content.count('\n') + (0 if content.endswith('\n') else 1)
+
+# Files larger than this are streamed instead of built into one JSON string
+FILE_VIEW_STREAM_THRESHOLD = 1024 * 1024
+FILE_VIEW_CHUNK_SIZE = 64 * 1024
+
+def _iter_file_view_json(path: Path, language: str, size: int) -> Iterator[bytes]:
     """
-    View file content
+    Stream the /file/view JSON body, escaping the content chunk by chunk.
+    "lines" is emitted last since it is only known once the file is read.
+    Undecodable bytes are replaced rather than retried as latin-1, since
+    earlier chunks have already been sent.
     """
-    try:
-        from pathlib import Path
-
-        # Security check: search for the file in allowed locations
-        search_dirs = [
-            Path.cwd(),
-            Path.cwd() / "output",
-            Path.cwd() / "test_sandbox"
-        ]
-        
-        found_path: Optional[Path] = None
-        
-        # To handle file paths from different OS, normalize them
-        normalized_file_path = Path(file_path)
+    head = orjson.dumps({"file_path": str(path), "language": language, "size": size})
+    yield head[:-1] + b',"content":"'
+    lines = 0
+    last_char = ""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        while chunk := f.read(FILE_VIEW_CHUNK_SIZE):
+            lines += chunk.count('\n')
+            last_char = chunk[-1]
+            yield orjson.dumps(chunk)[1:-1]
+    if last_char and last_char != '\n':
+        lines += 1
+    yield b'","lines":' + str(lines).encode() + b'}'
+
+def _prepare_file_view(file_path: str, raw: bool) -> tuple[Path, int, Optional[str]]:
+    """
+    Blocking part of /file/view: find and validate the file, stat it and, for a
+    small non-raw view, read it. Runs as one worker-thread hop instead of doing
+    a string of stat calls on the event loop.
+    Returns (resolved path, size, content or None when it should be streamed/sent raw).
+    """
+    # Security check: search for the file in allowed locations
+    cwd = Path.cwd()
+    search_dirs = _get_search_dirs(cwd)
+    
+    found_path: Optional[Path] = None
+    
+    # To handle file paths from different OS, normalize them
+    normalized_file_path = Path(file_path)
 
-        # 1. Check for absolute path first
-        if normalized_file_path.is_absolute() and normalized_file_path.exists():
-            found_path = normalized_file_path
-        
-        # 2. If not absolute, search in the standard directories
-        if not found_path:
-            for directory in search_dirs:
-                candidate = directory / normalized_file_path
-                if candidate.exists() and candidate.is_file():
-                    found_path = candidate
-                    break
-        
-        # 3. If still not found, search recursively inside 'output' for session folders
-        if not found_path:
-            output_dir = Path.cwd() / "output"
-            if output_dir.exists():
-                # Use rglob to find the file in any subdirectory of output
-                candidates = list(output_dir.rglob(normalized_file_path.name))
-                if candidates:
-                    found_path = candidates[0]  # Use the first match
-
-        if not found_path:
-            raise HTTPException(status_code=404, detail=f"File not found in any allowed directory: {file_path}")
-
-        file_path_obj = found_path.resolve()
-        
-        # Check if the final resolved path is within allowed directories
-        allowed_dirs_resolved = [d.resolve() for d in search_dirs]
-        is_allowed = any(
-            str(file_path_obj).startswith(str(allowed_dir))
-            for allowed_dir in allowed_dirs_resolved
+    # 1. Check for absolute path first
+    if normalized_file_path.is_absolute() and normalized_file_path.exists():
+        found_path = normalized_file_path
+    
+    # 2. If not absolute, search in the standard directories
+    if not found_path:
+        found_path = next(
+            (c for c in (d / normalized_file_path for d in search_dirs) if c.is_file()),
+            None
         )
+    
+    # 3. If still not found, look inside 'output' session folders via the file index
+    if not found_path:
+        found_path = _find_in_output_dir(normalized_file_path.name)
+
+    if not found_path:
+        raise HTTPException(status_code=404, detail=f"File not found in any allowed directory: {file_path}")
+
+    file_path_obj = found_path.resolve()
+    
+    # Check if the final resolved path is within allowed directories
+    allowed_dirs_resolved = _get_allowed_dirs_resolved(cwd)
+    is_allowed = any(
+        file_path_obj.is_relative_to(allowed_dir)
+        for allowed_dir in allowed_dirs_resolved
+    )
 
-        if not is_allowed:
-            raise HTTPException(status_code=403, detail="Access to this file is not allowed")
+    if not is_allowed:
+        raise HTTPException(status_code=403, detail="Access to this file is not allowed")
 
-        if not file_path_obj.is_file():
-            raise HTTPException(status_code=400, detail="Path is not a file")
+    if not file_path_obj.is_file():
+        raise HTTPException(status_code=400, detail="Path is not a file")
 
-        # Read file content
-        try:
-            with open(file_path_obj, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            with open(file_path_obj, 'r', encoding='latin-1') as f:
-                content = f.read()
+    if raw:
+        return file_path_obj, 0, None
+
+    size = file_path_obj.stat().st_size
+    content = _read_text_file(file_path_obj) if size <= FILE_VIEW_STREAM_THRESHOLD else None
+    return file_path_obj, size, content
+
+@app.get("/file/view")
+async def view_file(file_path: str, raw: bool = False):
+    """
+    View file content. With raw=true the file is sent as-is as text/plain.
+    """
+    try:
+        file_path_obj, size, content = await asyncio.to_thread(_prepare_file_view, file_path, raw)
+
+        if raw:
+            return FileResponse(file_path_obj, media_type="text/plain")
 
         # Detect file type for syntax highlighting
-        file_extension = file_path_obj.suffix.lower()
-        language_map = {
-            '.py': 'python',
-            '.js': 'javascript',
-            '.ts': 'typescript',
-            '.jsx': 'jsx',
-            '.tsx': 'tsx',
-            '.html': 'html',
-            '.css': 'css',
-            '.json': 'json',
-            '.md': 'markdown',
-            '.yml': 'yaml',
-            '.yaml': 'yaml',
-            '.xml': 'xml',
-            '.sh': 'bash',
-            '.sql': 'sql',
-            '.txt': 'text'
-        }
-        language = language_map.get(file_extension, 'text')
+        language = _LANGUAGE_MAP.get(file_path_obj.suffix.lower(), 'text')
+
+        if content is None:
+            return StreamingResponse(
+                _iter_file_view_json(file_path_obj, language, size),
+                media_type="application/json"
+            )
 
         return {
             "file_path": str(file_path_obj),
             "content": content,
             "language": language,
-            "size": len(content),
-            "lines": len(content.splitlines())
+            "size": size,
+            "lines": _count_lines(content)
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error viewing file: {str(e)}")
+        logger.error("Error viewing file: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
@@ -369,10 +558,19 @@ if __name__ == "__main__":
     print("📡 API server running on: http://localhost:8001")
     print("💡 Start React frontend separately with: cd react-frontend && npm run dev")
     
+    # Sessions live in process memory, so with WEB_CONCURRENCY > 1 the load
+    # balancer must route each session_id to the same worker (sticky sessions)
+    limit_concurrency = os.getenv("LIMIT_CONCURRENCY")
     uvicorn.run(
         "api_server:app",
         host="0.0.0.0",
         port=8001, 
         reload=False,
-        log_level="info"
+        log_level="info",
+        # uvloop and httptools come with uvicorn[standard]; uvloop has no Windows support
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None,
+        backlog=int(os.getenv("BACKLOG", "2048"))
     ) 
\ No newline at end of file
@@ -1,15 +1,21 @@
-from typing import TypedDict, Annotated, Literal, List, Dict, Any, Union, cast
+from typing import TypedDict, Annotated, Literal, List, Dict, Any, Union, AsyncGenerator
 import operator
 import os
+import asyncio
+import atexit
+import contextvars
 import httpx
 import uuid
-import json
 import logging
 import functools
+import hashlib
+import itertools
+import orjson
+import time
 from datetime import datetime
-from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage, SystemMessage
-from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage, SystemMessage, message_chunk_to_message
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.tools import tool, StructuredTool
 from langgraph.graph import StateGraph, END
 from dotenv import load_dotenv
 from pydantic import SecretStr, BaseModel
@@ -17,7 +23,7 @@ import subprocess
 import ast
 from pathlib import Path
 import re
-import difflib
+from collections import OrderedDict, deque
 
 # Configure logging for this module
 logger = logging.getLogger(__name__)
@@ -26,6 +32,14 @@ logger = logging.getLogger(__name__)
 # Always load .env located alongside this file, regardless of CWD
 load_dotenv(Path(__file__).resolve().parent / ".env")
 
+# Model used when a query doesn't name one. Read once; see reload_config().
+DEFAULT_LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-4o")
+
+def reload_config():
+    """Re-read LLM_MODEL from the environment after it was changed at runtime."""
+    global DEFAULT_LLM_MODEL
+    DEFAULT_LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-4o")
+
 # Each run gets its own subfolder inside `output` to avoid collisions
 BASE_OUTPUT_DIR = os.path.join(os.getcwd(), "output")
 os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
@@ -52,7 +66,17 @@ def setup_test_sandbox():
         try:
             if test_sandbox_dest.exists():
                 shutil.rmtree(test_sandbox_dest)
-            shutil.copytree(test_sandbox_src, test_sandbox_dest)
+            # Real copies, not links: the agent edits these files in place, which
+            # through a shared inode would modify the repo's own test_sandbox.
+            # shutil.copy keeps the mode (scripts stay executable) without
+            # copy2's per-file timestamp/xattr syscalls, and bytecode caches
+            # left by local test runs aren't worth copying.
+            shutil.copytree(
+                test_sandbox_src,
+                test_sandbox_dest,
+                copy_function=shutil.copy,
+                ignore=shutil.ignore_patterns("__pycache__", "*.pyc")
+            )
             print(f"📁 Copied test_sandbox to output directory for examples")
         except Exception as e:
             print(f"⚠️  Failed to copy test_sandbox: {e}")
@@ -98,7 +122,14 @@ EXPERT_DEFINITIONS = {
     }
 }
 
+# Icon per expert, precomputed for the event stream
+EXPERT_ICONS = {name: definition.get("icon", "🤖") for name, definition in EXPERT_DEFINITIONS.items()}
+
 # --- Sandboxing Helper ---
+# Resolved on every call, never memoized: sessions share the sandbox, and any
+# shell command (another session's, or one left running in the background) can
+# swap a directory for a symlink at any time, so a cached result could point
+# outside the sandbox without passing the check below again.
 def _get_safe_path(file_path: str) -> Path:
     """
     Resolves a user-provided path against the secure base directory
@@ -107,13 +138,20 @@ def _get_safe_path(file_path: str) -> Path:
     # Normalize and resolve the path
     safe_path = (_secure_base_dir / file_path).resolve()
 
-    # Check if the resolved path is within the secure base directory
-    if not str(safe_path).startswith(str(_secure_base_dir)):
+    # Check if the resolved path is within the secure base directory.
+    # is_relative_to compares path parts, so no str() conversions per call and
+    # a sibling like "output2" no longer passes a prefix check for "output".
+    if not safe_path.is_relative_to(_secure_base_dir):
         raise ValueError(f"Path traversal attempt detected. Access to '{file_path}' is denied.")
 
     return safe_path
 
 # --- Diff Helper ---
+DIFF_CONTEXT_LINES = 3
+# Above this many lines, unchanged leading/trailing lines are trimmed before diffing
+DIFF_TRIM_THRESHOLD_LINES = 2000
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@")
+
 def _generate_diff(before_content: str, after_content: str, file_path: str) -> Dict[str, Any]:
     """
     Generate diff information between before and after content.
@@ -121,29 +159,73 @@ def _generate_diff(before_content: str, after_content: str, file_path: str) -> D
     Returns:
         Dict containing diff text, added lines, removed lines, and statistics
     """
+    if before_content == after_content:
+        return {"diff_text": "", "added_lines": 0, "removed_lines": 0, "total_changes": 0}
+
+    import difflib  # only needed once a file actually changes
+
     before_lines = before_content.splitlines(keepends=True)
     after_lines = after_content.splitlines(keepends=True)
 
-    # Generate unified diff
-    diff_lines = list(difflib.unified_diff(
-        before_lines,
-        after_lines,
+    # On large files, lines shared at both ends can only ever appear as hunk
+    # context, so only the changed middle (plus its context) goes through
+    # SequenceMatcher. This keeps a small edit to a large file from costing a
+    # full-file diff. Small files are diffed whole, since trimming can change
+    # which of several equally valid alignments SequenceMatcher picks.
+    lead = trail = 0
+    limit = min(len(before_lines), len(after_lines))
+    if max(len(before_lines), len(after_lines)) > DIFF_TRIM_THRESHOLD_LINES:
+        prefix = 0
+        while prefix < limit and before_lines[prefix] == after_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and before_lines[-1 - suffix] == after_lines[-1 - suffix]:
+            suffix += 1
+        lead = max(0, prefix - DIFF_CONTEXT_LINES)
+        trail = max(0, suffix - DIFF_CONTEXT_LINES)
+
+    diff_parts = []
+    added_lines = removed_lines = 0
+    for line in difflib.unified_diff(
+        before_lines[lead:len(before_lines) - trail],
+        after_lines[lead:len(after_lines) - trail],
         fromfile=f"a/{file_path}",
         tofile=f"b/{file_path}",
+        n=DIFF_CONTEXT_LINES,
         lineterm=""
-    ))
-
-    # Count added and removed lines
-    added_lines = sum(1 for line in diff_lines if line.startswith('+') and not line.startswith('+++'))
-    removed_lines = sum(1 for line in diff_lines if line.startswith('-') and not line.startswith('---'))
+    ):
+        # Count added and removed lines in the same pass, dispatching on the first character once
+        tag = line[:1]
+        if tag == '+':
+            if line[:3] != '+++':
+                added_lines += 1
+        elif tag == '-':
+            if line[:3] != '---':
+                removed_lines += 1
+        elif lead and tag == '@':
+            # Hunk line numbers are relative to the trimmed slices
+            line = _HUNK_HEADER.sub(
+                lambda m: f"@@ -{int(m[1]) + lead}{m[2] or ''} +{int(m[3]) + lead}{m[4] or ''} @@", line
+            )
+        diff_parts.append(line)
 
     return {
-        "diff_text": ''.join(diff_lines),
+        "diff_text": ''.join(diff_parts),
         "added_lines": added_lines,
         "removed_lines": removed_lines,
         "total_changes": added_lines + removed_lines
     }
 
+# Edit results carry full before/after copies only up to this size; the diff
+# already describes the change, and the file itself stays on disk
+EDIT_RESULT_CONTENT_LIMIT = 4096
+
+def _edit_contents(before_content: str, after_content: str) -> Dict[str, str]:
+    """before_content/after_content fields for an edit result, or none for large files."""
+    if len(before_content) > EDIT_RESULT_CONTENT_LIMIT or len(after_content) > EDIT_RESULT_CONTENT_LIMIT:
+        return {}
+    return {"before_content": before_content, "after_content": after_content}
+
 # --- Core Development Tools ---
 
 @tool
@@ -166,10 +248,12 @@ def read_file(
     """
     try:
         safe_path = _get_safe_path(file_path)
-        with open(safe_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        # One bulk read and decode; undecodable bytes show up as U+FFFD instead of failing the read
+        text = safe_path.read_bytes().decode("utf-8", errors="replace")
         
         if start_line_one_indexed is not None and end_line_one_indexed_inclusive is not None:
+            lines = text.splitlines(keepends=True)
+
             # Adjust for 0-based indexing
             start_idx = start_line_one_indexed - 1
             end_idx = end_line_one_indexed_inclusive
@@ -184,8 +268,7 @@ def read_file(
             content = "".join(lines[start_idx:end_idx])
             return f"File contents of {file_path} (lines {start_line_one_indexed}-{end_line_one_indexed_inclusive}):\n\n{content}"
         else:
-            content = "".join(lines)
-            return f"File contents of {file_path} (entire file):\n\n{content}"
+            return f"File contents of {file_path} (entire file):\n\n{text}"
             
     except Exception as e:
         return f"Error reading file {file_path}: {str(e)}"
@@ -205,31 +288,29 @@ def write_file(file_path: str, content: str) -> str:
     try:
         safe_path = _get_safe_path(file_path)
 
-        # Check if file exists before writing
-        file_exists = safe_path.exists()
+        # One stat() tells both whether the file exists and whether there is anything to diff against
+        try:
+            existing_size = safe_path.stat().st_size
+            file_exists = True
+        except FileNotFoundError:
+            existing_size = 0
+            file_exists = False
         before_content = ""
 
-        if file_exists:
+        if existing_size:
             # Read existing content for diff
             try:
-                with open(safe_path, 'r', encoding='utf-8') as f:
-                    before_content = f.read()
+                before_content = safe_path.read_bytes().decode("utf-8")
             except Exception:
                 before_content = ""
 
         # Create parent directories if they don't exist
         safe_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Write the new content
-        with open(safe_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-
-        # Verify the file was written correctly
-        try:
-            with open(safe_path, 'r', encoding='utf-8') as f:
-                actual_content = f.read()
-        except Exception:
-            actual_content = ""
+        # Encode once and write the bytes in a single call. The bytes on disk
+        # are exactly content, so there is no need to read the file back.
+        safe_path.write_bytes(content.encode("utf-8"))
+        actual_content = content
 
         if file_exists:
             # Generate diff for existing file replacement
@@ -245,8 +326,7 @@ def write_file(file_path: str, content: str) -> str:
                 "message": success_message,
                 "file_path": file_path,
                 "operation": event_type,
-                "before_content": before_content,
-                "after_content": actual_content,
+                **_edit_contents(before_content, actual_content),
                 "diff": diff_info,
                 "success": diff_info["total_changes"] > 0 or before_content != actual_content
             }
@@ -264,10 +344,14 @@ def write_file(file_path: str, content: str) -> str:
                 "content": actual_content,
                 "success": len(actual_content) > 0
             }
-        return json.dumps(result_data)
+        return orjson.dumps(result_data).decode()
 
     except Exception as e:
-        return json.dumps({"error": f"Error writing to file {file_path}: {str(e)}", "success": False})
+        return orjson.dumps({"error": f"Error writing to file {file_path}: {str(e)}", "success": False}).decode()
+
+@functools.lru_cache(maxsize=128)
+def _compile_pattern(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
 
 @tool
 def find_and_replace_in_file(file_path: str, find_text: str, replace_text: str, use_regex: bool = False) -> str:
@@ -286,30 +370,41 @@ def find_and_replace_in_file(file_path: str, find_text: str, replace_text: str,
     try:
         safe_path = _get_safe_path(file_path)
 
-        # Read the original file content
-        with open(safe_path, 'r', encoding='utf-8') as f:
-            before_content = f.read()
-
-        # Perform replacement
-        if use_regex:
-            # Use regex mode
-            new_content = re.sub(find_text, replace_text, before_content)
-            replacements = len(re.findall(find_text, before_content))
-        else:
-            # Use literal string replacement (default)
-            new_content = before_content.replace(find_text, replace_text)
-            replacements = before_content.count(find_text)
-
-        # Write back to file
-        with open(safe_path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
-
-        # Verify the file was written correctly
-        try:
-            with open(safe_path, 'r', encoding='utf-8') as f:
-                actual_content = f.read()
-        except Exception:
-            actual_content = new_content
+        # Read, replace and write back through a single handle
+        with open(safe_path, 'r+b') as f:
+            # Strict decode: a file that isn't valid UTF-8 must not be rewritten
+            before_content = f.read().decode("utf-8")
+
+            if use_regex:
+                # subn returns the replacement count from the same pass
+                new_content, replacements = _compile_pattern(find_text).subn(replace_text, before_content)
+            elif find_text:
+                # Literal replacement (default): one split yields both the
+                # pieces to join and the match count
+                parts = before_content.split(find_text)
+                replacements = len(parts) - 1
+                new_content = replace_text.join(parts) if replacements else before_content
+            else:
+                # str.split rejects an empty separator; keep str.replace semantics
+                replacements = before_content.count(find_text)
+                new_content = before_content.replace(find_text, replace_text)
+
+            if replacements:
+                f.seek(0)
+                f.write(new_content.encode("utf-8"))
+                f.truncate()
+
+        if not replacements:
+            # Nothing matched: no write happened and there is nothing to diff.
+            # Say so plainly so the model fixes its anchor instead of assuming an edit.
+            return orjson.dumps({
+                "message": f"No matches for find_text in {file_path}; the file was not changed",
+                "file_path": file_path,
+                "operation": "edited_file_diff",
+                "diff": {"diff_text": "", "added_lines": 0, "removed_lines": 0, "total_changes": 0},
+                "success": False
+            }).decode()
+        actual_content = new_content
 
         # Generate diff information
         diff_info = _generate_diff(before_content, actual_content, file_path)
@@ -324,15 +419,14 @@ def find_and_replace_in_file(file_path: str, find_text: str, replace_text: str,
             "message": success_message,
             "file_path": file_path,
             "operation": "edited_file_diff",
-            "before_content": before_content,
-            "after_content": actual_content,
+            **_edit_contents(before_content, actual_content),
             "diff": diff_info,
             "success": diff_info["total_changes"] > 0
         }
-        return json.dumps(result_data)
+        return orjson.dumps(result_data).decode()
 
     except Exception as e:
-        return json.dumps({"error": f"Error in find and replace for {file_path}: {str(e)}", "success": False})
+        return orjson.dumps({"error": f"Error in find and replace for {file_path}: {str(e)}", "success": False}).decode()
 
 @tool
 def list_directory(directory_path: str = ".") -> str:
@@ -348,24 +442,43 @@ def list_directory(directory_path: str = ".") -> str:
     try:
         safe_path = _get_safe_path(directory_path)
         
-        if not safe_path.exists() or not safe_path.is_dir():
+        # is_dir() is False for a missing path too, so one stat covers both
+        if not safe_path.is_dir():
             return f"Directory {directory_path} does not exist or is not a directory."
         
+        # scandir entries carry the file type from the directory read itself,
+        # so only regular files need a stat() for their size
+        with os.scandir(safe_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
         items = []
-        for item in sorted(os.listdir(safe_path)):
-            item_path = os.path.join(safe_path, item)
-            if os.path.isdir(item_path):
-                items.append(f"📁 {item}/")
+        for entry in entries:
+            if entry.is_dir():
+                items.append(f"📁 {entry.name}/")
             else:
-                size = os.path.getsize(item_path)
-                items.append(f"📄 {item} ({size} bytes)")
+                items.append(f"📄 {entry.name} ({entry.stat().st_size} bytes)")
         
         return f"Contents of {directory_path}:\n" + "\n".join(items) if items else f"Directory {directory_path} is empty"
     except Exception as e:
         return f"Error listing directory {directory_path}: {str(e)}"
 
-@tool
-def execute_bash_command(command: str, working_directory: str = ".") -> str:
+BASH_COMMAND_TIMEOUT_SECONDS = 180
+# Per stream, only the last this-many bytes of a command's output are kept
+BASH_OUTPUT_TAIL_BYTES = 1024 * 1024
+_BASH_READ_CHUNK_SIZE = 64 * 1024
+
+def _format_command_output(command: str, working_directory: str, returncode: int | None, stdout: str, stderr: str) -> str:
+    output = f"Command: {command}\n"
+    output += f"Exit Code: {returncode}\n"
+    output += f"Working Directory: {working_directory}\n\n"
+    
+    if stdout:
+        output += f"STDOUT:\n{stdout}\n"
+    if stderr:
+        output += f"STDERR:\n{stderr}\n"
+        
+    return output
+
+def _run_bash_command(command: str, working_directory: str = ".") -> str:
     """
     Execute system commands for testing, building, or running code. Use this to run Python scripts, install packages, run tests, compile code, or perform any command-line operations. Includes timeout protection.
     
@@ -389,62 +502,332 @@ def execute_bash_command(command: str, working_directory: str = ".") -> str:
             cwd=safe_working_dir,
             capture_output=True,
             text=True,
-            timeout=180
+            timeout=BASH_COMMAND_TIMEOUT_SECONDS
         )
-        
-        output = f"Command: {command}\n"
-        output += f"Exit Code: {result.returncode}\n"
-        output += f"Working Directory: {working_directory}\n\n"
-        
-        if result.stdout:
-            output += f"STDOUT:\n{result.stdout}\n"
-        if result.stderr:
-            output += f"STDERR:\n{result.stderr}\n"
-            
-        return output
+        return _format_command_output(command, working_directory, result.returncode, result.stdout, result.stderr)
     except subprocess.TimeoutExpired:
         return f"Command timed out: {command}"
     except Exception as e:
         return f"Error executing command '{command}': {str(e)}"
 
+async def _read_output_tail(stream: asyncio.StreamReader) -> str:
+    """Read a process stream to EOF, keeping only its last BASH_OUTPUT_TAIL_BYTES.
+
+    Memory stays bounded however much a runaway command prints; dropped output
+    is summarized as a line count at the top.
+    """
+    chunks: deque[bytes] = deque()
+    size = 0
+    omitted_bytes = omitted_lines = 0
+    while chunk := await stream.read(_BASH_READ_CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        # Drop whole chunks while the rest still covers the tail
+        while size - len(chunks[0]) >= BASH_OUTPUT_TAIL_BYTES:
+            dropped = chunks.popleft()
+            size -= len(dropped)
+            omitted_bytes += len(dropped)
+            omitted_lines += dropped.count(b"\n")
+    data = b"".join(chunks)
+    if not omitted_bytes and size <= BASH_OUTPUT_TAIL_BYTES:
+        return data.decode("utf-8", errors="replace")
+
+    # Trim to the byte budget, then to the next line start so the tail begins cleanly
+    excess = len(data) - BASH_OUTPUT_TAIL_BYTES
+    if excess > 0:
+        omitted_lines += data.count(b"\n", 0, excess)
+        data = data[excess:]
+    if (newline := data.find(b"\n")) != -1:
+        omitted_lines += 1
+        data = data[newline + 1:]
+    return f"... [{omitted_lines} earlier lines omitted]\n" + data.decode("utf-8", errors="replace")
+
+async def _arun_bash_command(command: str, working_directory: str = ".") -> str:
+    """Async counterpart of _run_bash_command; waits on the process without holding a thread."""
+    try:
+        # Ensure the working directory is sandboxed
+        safe_working_dir = _get_safe_path(working_directory)
+        
+        if not safe_working_dir.is_dir():
+            return f"Error: Working directory '{working_directory}' is not a valid directory."
+
+        proc = await asyncio.create_subprocess_shell(
+            command,
+            cwd=safe_working_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        assert proc.stdout is not None and proc.stderr is not None
+        try:
+            stdout, stderr, _ = await asyncio.wait_for(
+                asyncio.gather(_read_output_tail(proc.stdout), _read_output_tail(proc.stderr), proc.wait()),
+                timeout=BASH_COMMAND_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return f"Command timed out: {command}"
+
+        return _format_command_output(command, working_directory, proc.returncode, stdout, stderr)
+    except Exception as e:
+        return f"Error executing command '{command}': {str(e)}"
+
+# Sync invoke() uses subprocess.run; ainvoke() (used by the tool executor)
+# uses an asyncio subprocess so concurrent commands don't each pin a thread
+execute_bash_command = StructuredTool.from_function(
+    func=_run_bash_command,
+    coroutine=_arun_bash_command,
+    name="execute_bash_command"
+)
+
 # --- Agent State ---
 class MultiAgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
     current_expert: str
-    debug_info: List[Dict[str, Any]]
+    # Nodes return only their new entries for these lists, so the graph appends them
+    debug_info: Annotated[List[Dict[str, Any]], operator.add]
     tool_failures: Dict[str, int]  # Track tool failure counts to prevent infinite loops
     tool_call_count: int  # Track total tool calls
     tool_call_history: List[Dict[str, Any]]  # Track tool call history for deduplication
     recent_files: List[str]  # Track recently created/modified files
-    file_operation_events: List[Dict[str, Any]]  # Track file operation events for frontend display
-    terminal_events: List[Dict[str, Any]]  # Track terminal events for frontend display
+    file_operation_events: Annotated[List[Dict[str, Any]], operator.add]  # Track file operation events for frontend display
+    terminal_events: Annotated[List[Dict[str, Any]], operator.add]  # Track terminal events for frontend display
+    model_name: str  # LLM model for this query (per request, not process-global)
+    parallel_tool_calls: bool  # Let consecutive read-only tool calls run concurrently (off by default)
 
 # --- Expert Agents ---
 
+def _get_model_name(state: MultiAgentState) -> str:
+    """Model requested for this query, falling back to DEFAULT_LLM_MODEL."""
+    return state.get("model_name") or DEFAULT_LLM_MODEL
+
+@functools.lru_cache(maxsize=32)
+def _is_anthropic_model(model_name: str) -> bool:
+    lowered = model_name.lower()
+    return "anthropic" in lowered or "claude" in lowered
+
+# One pooled HTTP client shared by every LLM client, so connections (and TLS
+# sessions) to OpenRouter are reused across models and calls
+_LLM_HTTP_HEADERS = {
+    "HTTP-Referer": "http://localhost:3000",
+    "X-Title": "Multi-Agent System"
+}
+_SHARED_HTTP_CLIENT = httpx.Client(
+    verify=False,
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    headers=_LLM_HTTP_HEADERS
+)
+atexit.register(_SHARED_HTTP_CLIENT.close)
+_SHARED_ASYNC_HTTP_CLIENT = httpx.AsyncClient(
+    verify=False,
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    headers=_LLM_HTTP_HEADERS
+)
+
+async def aclose_shared_http_clients():
+    """Close the pooled async HTTP client; call from the event loop that used it, on shutdown."""
+    await _SHARED_ASYNC_HTTP_CLIENT.aclose()
+
 @functools.lru_cache(maxsize=5)
 def create_llm_client(model_name: str):
     """Create a configured LLM client based on the provider specified in .env file."""
-    # Read model from environment variable
-    
-    http_client = httpx.Client(
-        verify=False,
-        timeout=30.0,
-        headers={
-            "HTTP-Referer": "http://localhost:3000",
-            "X-Title": "Multi-Agent System"
-        }
-    )
-    
+    # Imported here: langchain_openai (and the openai SDK under it) is the
+    # slowest import of this module and only needed once a query runs
+    from langchain_openai import ChatOpenAI
+
     # Force all models to use OpenRouter
     return ChatOpenAI(
         base_url="https://openrouter.ai/api/v1",
         api_key=SecretStr(key) if (key := os.getenv("OPENROUTER_API_KEY")) else None,
         model=model_name,
-        http_client=http_client,
+        http_client=_SHARED_HTTP_CLIENT,
+        http_async_client=_SHARED_ASYNC_HTTP_CLIENT,
         timeout=30.0,
+        # Streamed responses only carry usage_metadata (and with it the
+        # prompt-cache counts in debug_info) when usage is requested
+        stream_usage=True,
     )
 
-def coordinator_node(state: MultiAgentState):
+# --- Expert Response Cache ---
+class LLMCache:
+    """
+    In-memory TTL + LRU cache of expert LLM responses, keyed by everything that
+    determines the request (model, temperature, bound tools, full message list).
+    Only useful for deterministic setups, so it is opt-in via LLM_CACHE=1.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def _message_key_fields(message: BaseMessage) -> List[Any]:
+        # Only what the model sees. model_dump() would also pull in provider
+        # response ids and usage metadata, which differ on every call and kept
+        # identical conversations from ever sharing a key.
+        fields: List[Any] = [message.type, message.content]
+        if isinstance(message, AIMessage):
+            fields.append([(tool_call["name"], tool_call["args"]) for tool_call in message.tool_calls])
+        return fields
+
+    @staticmethod
+    def cache_key(model: str, messages: List[BaseMessage], temperature: float | None, tools: List[Any]) -> str:
+        payload = orjson.dumps({
+            "model": model,
+            "temperature": temperature,
+            "tools": sorted(t.name for t in tools),
+            "messages": [LLMCache._message_key_fields(m) for m in messages],
+        }, option=orjson.OPT_SORT_KEYS, default=str)
+        return hashlib.blake2b(payload, digest_size=32).hexdigest()
+
+    def get(self, key: str) -> AIMessage | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, data = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        # Hand out a fresh message each time so callers never share one object
+        return AIMessage.model_validate(data)
+
+    def set(self, key: str, message: AIMessage):
+        self._entries[key] = (time.monotonic(), message.model_dump())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+_llm_cache = LLMCache(ttl=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))) if os.getenv("LLM_CACHE", "0") == "1" else None
+
+# Queue the runner reads token deltas from while an expert node is running.
+# Unset (None) outside the runner, in which case experts make a plain call.
+_token_sink: contextvars.ContextVar["asyncio.Queue[str | None] | None"] = contextvars.ContextVar("_token_sink", default=None)
+
+async def _acall_model(model_with_tools, messages: List[BaseMessage]) -> tuple[BaseMessage, int]:
+    """Call the model, streaming text deltas to the token sink when one is set.
+
+    Returns the response and the number of chunks it was streamed in (0 for a plain call).
+    """
+    sink = _token_sink.get()
+    if sink is None:
+        return await model_with_tools.ainvoke(messages), 0
+
+    aggregate = None
+    stream_chunks = 0
+    async for chunk in model_with_tools.astream(messages):
+        stream_chunks += 1
+        aggregate = chunk if aggregate is None else aggregate + chunk
+        if isinstance(chunk.content, str) and chunk.content:
+            sink.put_nowait(chunk.content)
+    # Merged chunks carry the parsed tool calls, same as an ainvoke response
+    return (message_chunk_to_message(aggregate) if aggregate is not None else AIMessage(content="")), stream_chunks
+
+async def _ainvoke_expert(model_with_tools, messages: List[BaseMessage], model_name: str, tools: List[Any]) -> tuple[BaseMessage, int]:
+    """Invoke an expert model, consulting the response cache when it is enabled.
+
+    Returns the response and its stream chunk count, as _acall_model does.
+    """
+    if _llm_cache is None:
+        return await _acall_model(model_with_tools, messages)
+
+    key = LLMCache.cache_key(model_name, messages, create_llm_client(model_name).temperature, tools)
+    if (cached := _llm_cache.get(key)) is not None:
+        logger.info("💾 Using cached expert response")
+        return cached, 0
+
+    response, stream_chunks = await _acall_model(model_with_tools, messages)
+    if isinstance(response, AIMessage):
+        _llm_cache.set(key, response)
+    return response, stream_chunks
+
+# --- Prompt Tracing ---
+def _log_prompt(title: str, messages: List[BaseMessage]):
+    """Log every message of an expert prompt; skipped entirely unless DEBUG is enabled."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    # The system prefix digest must stay constant across iterations for provider prompt caching to hit
+    if messages and isinstance(messages[0], SystemMessage):
+        prefix_digest = hashlib.blake2b(str(messages[0].content).encode("utf-8"), digest_size=8).hexdigest()
+        logger.debug("🔍 %s PROMPT (system prefix %s):", title, prefix_digest)
+    else:
+        logger.debug("🔍 %s PROMPT:", title)
+    for i, msg in enumerate(messages):
+        content = str(msg.content)
+        logger.debug("  Message %d (%s): %s%s", i + 1, type(msg).__name__, content[:500], "..." if len(content) > 500 else "")
+    logger.debug("-------------------------------- END OF %s PROMPT --------------------------------", title)
+
+def _prompt_snapshot(messages: List[BaseMessage]) -> List[Dict[str, Any]]:
+    """Prompt dump for debug_info / frontend display.
+
+    The full history is only serialized at DEBUG level; otherwise just the
+    newest message is kept so long sessions don't re-copy the whole history
+    on every node call.
+    """
+    if logger.isEnabledFor(logging.DEBUG) or len(messages) <= 1:
+        return [_snapshot_message(msg) for msg in messages]
+    return [
+        {"type": "omitted", "content": f"{len(messages) - 1} earlier messages omitted (set LOG_LEVEL=DEBUG for the full prompt)"},
+        _snapshot_message(messages[-1]),
+    ]
+
+def _snapshot_message(msg: BaseMessage) -> Dict[str, Any]:
+    """What the debug view shows of a message, read straight off its attributes.
+
+    model_dump() walks the whole pydantic model (ids, metadata, usage) for
+    fields the debug view never displays.
+    """
+    snapshot: Dict[str, Any] = {"type": msg.type, "content": msg.content}
+    if isinstance(msg, AIMessage) and msg.tool_calls:
+        snapshot["tool_calls"] = msg.tool_calls
+    elif isinstance(msg, ToolMessage):
+        snapshot["tool_call_id"] = msg.tool_call_id
+    return snapshot
+
+# --- Routing Shortcuts ---
+# Each expert's keywords are counted in the query; a single top scorer skips
+# the routing LLM call entirely. No match, or a tie (e.g. "create a plan"),
+# still goes to the LLM.
+_ROUTING_KEYWORDS = {
+    "Planner": re.compile(r"\b(plan|planning|roadmap|break (it |this )?down|step[- ]by[- ]step|what files)\b"),
+    # Only explicit review intent: "check", "bug" or "security" also show up in
+    # requests to fix or build something, so those are left to the routing LLM
+    "CodeReviewer": re.compile(r"\b(review|reviews|reviewing|audit|auditing)\b"),
+    "CodeGenerator": re.compile(r"\b(write|create|implement|generate|build|scaffold)\b"),
+}
+ROUTING_CACHE_MAXSIZE = 512
+# (model_name, normalized query) -> expert chosen by the routing LLM
+_routing_cache: "OrderedDict[tuple[str, str], str]" = OrderedDict()
+
+def _normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower().strip())[:256]
+
+@functools.lru_cache(maxsize=ROUTING_CACHE_MAXSIZE)
+def _route_by_keywords(normalized_query: str) -> str | None:
+    """Return the expert with the most keyword hits, or None if nothing matches or the top score is tied."""
+    scores = sorted(
+        ((sum(1 for _ in pattern.finditer(normalized_query)), expert) for expert, pattern in _ROUTING_KEYWORDS.items()),
+        reverse=True,
+    )
+    (best, expert), (runner_up, _) = scores[0], scores[1]
+    return expert if best > runner_up else None
+
+def _get_cached_route(model_name: str, normalized_query: str) -> str | None:
+    key = (model_name, normalized_query)
+    expert = _routing_cache.get(key)
+    if expert is not None:
+        _routing_cache.move_to_end(key)
+    return expert
+
+def _cache_route(model_name: str, normalized_query: str, expert: str):
+    _routing_cache[(model_name, normalized_query)] = expert
+    while len(_routing_cache) > ROUTING_CACHE_MAXSIZE:
+        _routing_cache.popitem(last=False)
+
+async def coordinator_node(state: MultiAgentState):
     """
     Routes user queries to the appropriate expert based on intelligent content analysis.
     """
@@ -457,7 +840,7 @@ def coordinator_node(state: MultiAgentState):
     else:
         user_query = str(last_message.content)
     
-    logger.info(f"🎯 Coordinator analyzing query: '{user_query[:100]}...'")
+    logger.info("🎯 Coordinator analyzing query: '%s...'", user_query[:100])
     
     # Create routing prompt
     routing_prompt = f"""You are an expert Coordinator AI. Your task is to analyze a user's request and route it to the most qualified specialized agent.
@@ -488,25 +871,54 @@ Examples:
     ]
     
     try:
-        model_name = os.getenv("LLM_MODEL", "openai/gpt-4o")
+        model_name = _get_model_name(state)
+        normalized_query = _normalize_query(str(user_query))
+
+        # Skip the routing LLM call on an unambiguous keyword match or a repeated query
+        shortcut_reason = None
+        step = "routing"
+        if (expert_choice := _route_by_keywords(normalized_query)) is not None:
+            shortcut_reason = "keyword match"
+            step = "routing_fast"
+        elif (expert_choice := _get_cached_route(model_name, normalized_query)) is not None:
+            shortcut_reason = "cached routing decision"
+            step = "routing_cache_hit"
+
+        if shortcut_reason:
+            logger.info("🎯 Coordinator routing to: %s (%s)", expert_choice, shortcut_reason)
+            return {
+                "current_expert": expert_choice,
+                "debug_info": [{
+                    "step": step,
+                    "expert": expert_choice,
+                    "reasoning": f"Routed '{user_query[:50]}...' to {expert_choice} ({shortcut_reason})",
+                    "timestamp": datetime.now().isoformat(),
+                    "prompt": routing_messages,
+                    "source": shortcut_reason,
+                }]
+            }
+
         llm = create_llm_client(model_name)
     
         # Output complete prompt
-        logger.info("🔍 COORDINATOR PROMPT:")
-        for i, msg in enumerate(routing_messages):
-            logger.info(f"  Message {i+1} ({msg['role']}): {msg['content']}")
-        logger.info("-------------------------------- END OF COORDINATOR PROMPT --------------------------------")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔍 COORDINATOR PROMPT:")
+            for i, msg in enumerate(routing_messages):
+                logger.debug("  Message %d (%s): %s", i + 1, msg['role'], msg['content'])
+            logger.debug("-------------------------------- END OF COORDINATOR PROMPT --------------------------------")
         
-        response = llm.invoke(routing_messages)
+        response = await llm.ainvoke(routing_messages)
         expert_choice = str(response.content).strip() if response.content else "CodeGenerator"
         
-        logger.info(f"🎯 Coordinator routing to: {expert_choice}")
+        logger.info("🎯 Coordinator routing to: %s", expert_choice)
         
         # Validate expert choice
         valid_experts = ["CodeGenerator", "CodeReviewer", "Planner"]
         if expert_choice not in valid_experts:
-            logger.warning(f"⚠️ Invalid expert choice '{expert_choice}', defaulting to CodeGenerator")
+            logger.warning("⚠️ Invalid expert choice '%s', defaulting to CodeGenerator", expert_choice)
             expert_choice = "CodeGenerator"
+        # Cache the fallback too, so a query the model can't label isn't re-asked every time
+        _cache_route(model_name, normalized_query, expert_choice)
             
         # Add the full prompt to the debug info for transparency
         debug_info = {
@@ -515,6 +927,7 @@ Examples:
             "reasoning": f"Routed '{user_query[:50]}...' to {expert_choice}",
             "timestamp": datetime.now().isoformat(),
             "prompt": routing_messages,
+            "source": "llm",
         }
         
         # Update state by returning only the changed fields
@@ -524,7 +937,7 @@ Examples:
         }
         
     except Exception as e:
-        logger.error(f"❌ Error in coordinator routing: {str(e)}")
+        logger.error("❌ Error in coordinator routing: %s", e)
         # Fallback to CodeGenerator and return only changed fields
         debug_info = {
             "step": "routing_error",
@@ -538,11 +951,10 @@ Examples:
             "debug_info": [debug_info]
         }
         
-def code_generator_node(state: MultiAgentState):
-    """Code Generator specializes in generating code solutions and implementations."""
-    logger.info("⚡ Code Generator starting task processing")
-    
-    system_prompt = """You are a Code Generator AI assistant. You specialize in:
+# --- Expert System Prompts ---
+# Kept static (no per-turn interpolation) so the prompt prefix is identical
+# across turns and provider-side prompt caching can reuse it.
+_CODE_GENERATOR_SYSTEM_PROMPT = """You are a Code Generator AI assistant. You specialize in:
     - Writing and generating code files
     - Implementing features based on specifications  
     - Creating complete solutions from requirements
@@ -556,29 +968,129 @@ def code_generator_node(state: MultiAgentState):
     - Be thorough and complete your tasks properly
     
     You can use tools as many times as needed to complete the task properly. Focus on delivering high-quality, working solutions."""
+
+_CODE_REVIEWER_SYSTEM_PROMPT = """You are a Code Reviewer AI assistant. You specialize in:
+    - Code review and quality assurance
+    - Security checks and best practices
+    - Bug detection and performance analysis
+    - Code formatting and standards validation
+    - Improving code quality and maintainability
     
-    model_name = os.getenv("LLM_MODEL", "openai/gpt-4o")
-    model = create_llm_client(model_name)
-    tools = [write_file, find_and_replace_in_file, read_file, list_directory, execute_bash_command]
-    model_with_tools = model.bind_tools(tools)
+    IMPORTANT PRINCIPLES:
+    - **CRITICAL: When you need to make multiple changes to a file (e.g., adding comments to multiple test cases), perform all edits in a single turn by calling the `find_and_replace_in_file` tool multiple times for each change. Do not make just one change and wait for the result. Complete all required edits at once.**
+    - Be proactive in finding and analyzing code
+    - The conversation history contains file contents from previous operations
+    - Test code after making changes to ensure it still works
+    - Provide comprehensive analysis with actionable recommendations
+    - Focus on delivering thorough code review and improvements
+    
+    You can use tools as many times as needed to provide thorough code review and improvements."""
+
+@functools.lru_cache(maxsize=16)
+def _static_system_message(prompt: str, is_anthropic: bool) -> SystemMessage:
+    """Build the system message for a static prompt, marking it cacheable for Anthropic.
+
+    Memoized, so every iteration sends the very same message object; nothing
+    mutates it (_ensure_nonempty_assistant only replaces AI messages).
+    """
+    if is_anthropic:
+        # Anthropic only caches explicitly marked blocks; OpenAI caches prefixes automatically
+        return SystemMessage(content=[{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}])
+    return SystemMessage(content=prompt)
+
+# Approximate token budget for the turns before the latest user message; past
+# it, the oldest turns are left out of the expert prompt (0 disables this)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+
+def _compact_history(msgs: list[BaseMessage], max_tokens: int | None = None) -> list[BaseMessage]:
+    """Return msgs without their oldest turns once the earlier turns exceed the budget.
+
+    A turn is a user message and everything up to the next one. Turns are
+    dropped whole, oldest first, so an AI tool call never loses its result and
+    the history still starts with a user message. The latest user turn is
+    always kept; since only earlier turns are counted, the result is the same
+    across the tool-calling iterations of a turn (and provider prompt caches
+    keep hitting). The input list is not modified.
+    """
+    budget = HISTORY_TOKEN_BUDGET if max_tokens is None else max_tokens
+    if budget <= 0:
+        return msgs
+    turn_starts = [i for i, m in enumerate(msgs) if isinstance(m, HumanMessage)]
+    if len(turn_starts) < 2:
+        return msgs
+    current_turn = turn_starts[-1]
+    sizes = [count_tokens_approximately([m]) for m in msgs[:current_turn]]
+    excess = sum(sizes) - budget
+    if excess <= 0:
+        return msgs
+
+    # Anything before the first user message goes with the first turn
+    boundaries = [0] + turn_starts[1:]
+    for start, next_start in zip(boundaries, boundaries[1:]):
+        excess -= sum(sizes[start:next_start])
+        if excess <= 0:
+            return msgs[next_start:]
+    return msgs[current_turn:]
+
+def _mark_history_cacheable(msgs: list[BaseMessage]) -> list[BaseMessage]:
+    """Return msgs with a second Anthropic cache breakpoint on the latest user turn.
+
+    Everything up to that turn stays identical across the tool-calling
+    iterations that follow it, so those iterations only pay for their own
+    tool results. The session's message is copied, not modified.
+    """
+    for i in range(len(msgs) - 1, -1, -1):
+        if isinstance(msgs[i], HumanMessage):
+            break
+    else:
+        return msgs
+    content = msgs[i].content
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]
+    elif content and isinstance(content[-1], dict):
+        blocks = content[:-1] + [{**content[-1], "cache_control": {"type": "ephemeral"}}]
+    else:
+        return msgs
+    marked = list(msgs)
+    marked[i] = msgs[i].model_copy(update={"content": blocks})
+    return marked
+
+def _prompt_cache_usage(response: BaseMessage) -> Dict[str, int]:
+    """Prompt-cache token counts reported for a response, for debug_info.
+
+    Only counts the provider actually reported are included: OpenRouter's
+    OpenAI-format usage gives cached (read) prompt tokens but not cache writes,
+    so cache_creation_input_tokens is usually absent rather than 0.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return {}
+    details = usage.get("input_token_details") or {}
+    counts = {"cache_read_input_tokens": details.get("cache_read", 0)}
+    if "cache_creation" in details:
+        counts["cache_creation_input_tokens"] = details["cache_creation"]
+    return counts
+
+async def code_generator_node(state: MultiAgentState):
+    """Code Generator specializes in generating code solutions and implementations."""
+    logger.info("⚡ Code Generator starting task processing")
+    
+    model_name = _get_model_name(state)
+    tools = _EXPERT_TOOLS["code_generator"]
+    model_with_tools = _bound_model(model_name, "code_generator")
     
     try:
-        is_anthropic = "anthropic" in model_name.lower() or "claude" in model_name.lower()
+        is_anthropic = _is_anthropic_model(model_name)
         
         # The message list is now much simpler
-        messages_for_expert = [SystemMessage(content=system_prompt)] + state["messages"]
+        messages_for_expert = [_static_system_message(_CODE_GENERATOR_SYSTEM_PROMPT, is_anthropic)] + _compact_history(state["messages"])
         
         # Output complete prompt
-        logger.info("🔍 CODE GENERATOR PROMPT:")
-        for i, msg in enumerate(messages_for_expert):
-            if hasattr(msg, 'content'):
-                content = str(msg.content)
-                logger.info(f"  Message {i+1} ({type(msg).__name__}): {content[:500]}{'...' if len(content) > 500 else ''}")
-        logger.info("-------------------------------- END OF CODE GENERATOR PROMPT --------------------------------")
-
-        # Ensure Anthropic compatibility (no empty assistant content)
-        safe_messages = _ensure_nonempty_assistant(messages_for_expert) if is_anthropic else messages_for_expert
-        response = model_with_tools.invoke(safe_messages)
+        _log_prompt("CODE GENERATOR", messages_for_expert)
+
+        # Ensure Anthropic compatibility (no empty assistant content) and cache the history prefix
+        safe_messages = _mark_history_cacheable(_ensure_nonempty_assistant(messages_for_expert)) if is_anthropic else messages_for_expert
+        response, stream_chunks = await _ainvoke_expert(model_with_tools, safe_messages, model_name, tools)
         
         response_content = str(response.content)
         debug_info = {
@@ -587,7 +1099,9 @@ def code_generator_node(state: MultiAgentState):
             "has_tool_calls": isinstance(response, AIMessage) and bool(response.tool_calls),
             "response_preview": response_content[:100] + "..." if len(response_content) > 100 else response_content,
             "response_full": response_content,
-            "prompt": [msg.dict() for msg in messages_for_expert]
+            "prompt": _prompt_snapshot(messages_for_expert),
+            **_prompt_cache_usage(response),
+            "stream_chunks": stream_chunks,
         }
         
         return {
@@ -602,53 +1116,32 @@ def code_generator_node(state: MultiAgentState):
             "debug_info": [{"error": str(e), "node": "code_generator"}]
         }
 
-def code_reviewer_node(state: MultiAgentState):
+async def code_reviewer_node(state: MultiAgentState):
     """Code reviewer that handles code review and quality assurance."""
     
     # Check if there are recent files to provide context
     recent_files_info = ""
     if "recent_files" in state and state["recent_files"]:
-        recent_files_info = f"\n\nCONTEXT: Recently created/modified files in this session: {', '.join(state['recent_files'])}"
+        recent_files_info = f"CONTEXT: Recently created/modified files in this session: {', '.join(state['recent_files'])}"
     
-    system_prompt = f"""You are a Code Reviewer AI assistant. You specialize in:
-    - Code review and quality assurance
-    - Security checks and best practices
-    - Bug detection and performance analysis
-    - Code formatting and standards validation
-    - Improving code quality and maintainability
-    
-    IMPORTANT PRINCIPLES:
-    - **CRITICAL: When you need to make multiple changes to a file (e.g., adding comments to multiple test cases), perform all edits in a single turn by calling the `find_and_replace_in_file` tool multiple times for each change. Do not make just one change and wait for the result. Complete all required edits at once.**
-    - Be proactive in finding and analyzing code
-    - The conversation history contains file contents from previous operations
-    - Test code after making changes to ensure it still works
-    - Provide comprehensive analysis with actionable recommendations
-    - Focus on delivering thorough code review and improvements
-    
-    You can use tools as many times as needed to provide thorough code review and improvements.{recent_files_info}"""
-    
-    model_name = os.getenv("LLM_MODEL", "openai/gpt-4o")
-    model = create_llm_client(model_name)
-    tools = [read_file, list_directory, find_and_replace_in_file, execute_bash_command]
-    model_with_tools = model.bind_tools(tools)
+    model_name = _get_model_name(state)
+    tools = _EXPERT_TOOLS["code_reviewer"]
+    model_with_tools = _bound_model(model_name, "code_reviewer")
     
     try:
-        is_anthropic = "anthropic" in model_name.lower() or "claude" in model_name.lower()
+        is_anthropic = _is_anthropic_model(model_name)
 
-        # The message list is now much simpler
-        messages_for_expert = [SystemMessage(content=system_prompt)] + state["messages"]
+        # Static prompt first so providers can cache it; per-turn context goes last
+        messages_for_expert = [_static_system_message(_CODE_REVIEWER_SYSTEM_PROMPT, is_anthropic)] + _compact_history(state["messages"])
+        if recent_files_info:
+            messages_for_expert.append(SystemMessage(content=recent_files_info))
         
         # Output complete prompt
-        logger.info("🔍 CODE REVIEWER PROMPT:")
-        for i, msg in enumerate(messages_for_expert):
-            if hasattr(msg, 'content'):
-                content = str(msg.content)
-                logger.info(f"  Message {i+1} ({type(msg).__name__}): {content[:500]}{'...' if len(content) > 500 else ''}")
-        logger.info("-------------------------------- END OF CODE REVIEWER PROMPT --------------------------------")
+        _log_prompt("CODE REVIEWER", messages_for_expert)
         
-        # Ensure Anthropic compatibility (no empty assistant content)
-        safe_messages = _ensure_nonempty_assistant(messages_for_expert) if is_anthropic else messages_for_expert
-        response = model_with_tools.invoke(safe_messages)
+        # Ensure Anthropic compatibility (no empty assistant content) and cache the history prefix
+        safe_messages = _mark_history_cacheable(_ensure_nonempty_assistant(messages_for_expert)) if is_anthropic else messages_for_expert
+        response, stream_chunks = await _ainvoke_expert(model_with_tools, safe_messages, model_name, tools)
         
         response_content = str(response.content)
         debug_info = {
@@ -657,7 +1150,9 @@ def code_reviewer_node(state: MultiAgentState):
             "has_tool_calls": isinstance(response, AIMessage) and bool(response.tool_calls),
             "response_preview": response_content[:100] + "..." if len(response_content) > 100 else response_content,
             "response_full": response_content,
-            "prompt": [msg.dict() for msg in messages_for_expert]
+            "prompt": _prompt_snapshot(messages_for_expert),
+            **_prompt_cache_usage(response),
+            "stream_chunks": stream_chunks,
         }
         
         return {
@@ -672,18 +1167,13 @@ def code_reviewer_node(state: MultiAgentState):
             "debug_info": [{"error": str(e), "node": "code_reviewer"}]
         }
 
-def planner_node(state: MultiAgentState):
+async def planner_node(state: MultiAgentState):
     """Planner node that analyzes tasks and creates detailed execution plans."""
     logger.info("📋 PLANNER starting task analysis")
 
     # Import PLANNER tools and functions
     try:
-        from planner_node import (
-            read_file as planner_read_file,
-            list_directory as planner_list_directory,
-            execute_safe_bash,
-            get_planner_system_prompt
-        )
+        from planner_node import get_planner_system_prompt
     except ImportError:
         error_msg = AIMessage(content="PLANNER node is not available. Please ensure planner_node.py is in the same directory.")
         return {
@@ -694,28 +1184,22 @@ def planner_node(state: MultiAgentState):
     # Get system prompt (default to comprehensive planning)
     system_prompt = get_planner_system_prompt("comprehensive")
 
-    model_name = os.getenv("LLM_MODEL", "openai/gpt-4o")
-    model = create_llm_client(model_name)
-    tools = [planner_read_file, planner_list_directory, execute_safe_bash]
-    model_with_tools = model.bind_tools(tools)
+    model_name = _get_model_name(state)
+    tools = _EXPERT_TOOLS["planner"]
+    model_with_tools = _bound_model(model_name, "planner")
 
     try:
-        is_anthropic = "anthropic" in model_name.lower() or "claude" in model_name.lower()
+        is_anthropic = _is_anthropic_model(model_name)
 
         # Prepare messages for planner
-        messages_for_planner = [SystemMessage(content=system_prompt)] + state["messages"]
+        messages_for_planner = [_static_system_message(system_prompt, is_anthropic)] + _compact_history(state["messages"])
 
         # Output complete prompt
-        logger.info("🔍 PLANNER PROMPT:")
-        for i, msg in enumerate(messages_for_planner):
-            if hasattr(msg, 'content'):
-                content = str(msg.content)
-                logger.info(f"  Message {i+1} ({type(msg).__name__}): {content[:500]}{'...' if len(content) > 500 else ''}")
-        logger.info("-------------------------------- END OF PLANNER PROMPT --------------------------------")
+        _log_prompt("PLANNER", messages_for_planner)
 
-        # Ensure Anthropic compatibility (no empty assistant content)
-        safe_messages = _ensure_nonempty_assistant(messages_for_planner) if is_anthropic else messages_for_planner
-        response = model_with_tools.invoke(safe_messages)
+        # Ensure Anthropic compatibility (no empty assistant content) and cache the history prefix
+        safe_messages = _mark_history_cacheable(_ensure_nonempty_assistant(messages_for_planner)) if is_anthropic else messages_for_planner
+        response, stream_chunks = await _ainvoke_expert(model_with_tools, safe_messages, model_name, tools)
 
         response_content = str(response.content)
         debug_info = {
@@ -724,7 +1208,9 @@ def planner_node(state: MultiAgentState):
             "has_tool_calls": isinstance(response, AIMessage) and bool(response.tool_calls),
             "response_preview": response_content[:100] + "..." if len(response_content) > 100 else response_content,
             "response_full": response_content,
-            "prompt": [msg.dict() for msg in messages_for_planner]
+            "prompt": _prompt_snapshot(messages_for_planner),
+            **_prompt_cache_usage(response),
+            "stream_chunks": stream_chunks,
         }
 
         return {
@@ -739,8 +1225,202 @@ def planner_node(state: MultiAgentState):
             "debug_info": [{"error": str(e), "node": "planner"}]
         }
 
-def tool_executor_node(state: MultiAgentState):
-    """Executes tool calls and returns results."""
+# Set PARALLEL_TOOL_CALLS=1 to let consecutive read-only calls of one turn run
+# concurrently. Off by default, so every call runs in the order it was emitted.
+PARALLEL_TOOL_CALLS = os.getenv("PARALLEL_TOOL_CALLS", "0") == "1"
+# Upper bound on how many read-only calls of one batch run at once, so a turn
+# with dozens of reads doesn't occupy every executor thread. This is only a
+# resource limit; ordering of mutating calls is handled in tool_executor_node.
+MAX_CONCURRENT_TOOL_CALLS = 8
+
+# Built once at import time; dispatch is a single dict lookup per tool call
+_TOOL_REGISTRY: Dict[str, Any] = {
+    "write_file": write_file,
+    "read_file": read_file,
+    "find_and_replace_in_file": find_and_replace_in_file,
+    "list_directory": list_directory,
+    "execute_bash_command": execute_bash_command
+}
+
+# Tools each expert node is bound with
+_EXPERT_TOOLS: Dict[str, List[Any]] = {
+    "code_generator": [write_file, find_and_replace_in_file, read_file, list_directory, execute_bash_command],
+    "code_reviewer": [read_file, list_directory, find_and_replace_in_file, execute_bash_command],
+}
+
+# Add PLANNER tools if available
+try:
+    from planner_node import read_file as planner_read_file, list_directory as planner_list_directory, execute_safe_bash
+    # Note: PLANNER uses same names for read_file and list_directory
+    # but with different implementations, so we keep the original ones
+    _TOOL_REGISTRY["execute_safe_bash"] = execute_safe_bash
+    _EXPERT_TOOLS["planner"] = [planner_read_file, planner_list_directory, execute_safe_bash]
+except ImportError:
+    logger.warning("PLANNER tools not available for tool execution")
+
+@functools.lru_cache(maxsize=16)
+def _bound_model(model_name: str, node: str):
+    """The model for `node` with its tools bound. bind_tools converts every tool
+    schema on each call, and a node always binds the same tools, so the bound
+    model is built once per (model, node) and reused across turns."""
+    return create_llm_client(model_name).bind_tools(_EXPERT_TOOLS[node])
+
+class ToolResultCache:
+    """
+    Short-lived LRU cache of read-only tool results (read_file, list_directory),
+    keyed by tool signature. Every other tool may change files, so each one
+    clears the cache when it starts and again when it finishes; a read that
+    overlapped such a call is not stored, since it may have seen either state.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        # Bumped on every mutating call start/finish, to detect overlapping reads
+        self.epoch = 0
+        self._mutations_in_flight = 0
+
+    def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def set(self, key: str, result: str, started_epoch: int):
+        if started_epoch != self.epoch or self._mutations_in_flight:
+            return
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def begin_mutation(self):
+        self._mutations_in_flight += 1
+        self.epoch += 1
+        self._entries.clear()
+
+    def end_mutation(self):
+        self._mutations_in_flight -= 1
+        self.epoch += 1
+        self._entries.clear()
+
+_READ_ONLY_TOOLS = frozenset({"read_file", "list_directory"})
+# TOOL_RESULT_CACHE_TTL_SECONDS=0 turns the cache off
+_tool_result_cache = (
+    ToolResultCache(ttl=ttl) if (ttl := float(os.getenv("TOOL_RESULT_CACHE_TTL_SECONDS", "30"))) > 0 else None
+)
+
+async def _invoke_tool(tool_name: str, tool_args: Dict[str, Any]) -> str | None:
+    """Run a single tool by name. Returns None for unknown tools; tool errors propagate."""
+    tool_function = _TOOL_REGISTRY.get(tool_name)
+    if tool_function is None:
+        return None
+
+    cache = _tool_result_cache
+    cache_key = None
+    if cache is not None:
+        if tool_name in _READ_ONLY_TOOLS:
+            cache_key = _tool_signature(tool_name, tool_args)
+            if (cached := cache.get(cache_key)) is not None:
+                logger.info("💾 Using cached result for tool %s", tool_name)
+                return cached
+            started_epoch = cache.epoch
+        else:
+            cache.begin_mutation()
+
+    # Sync tools are run in the default executor by ainvoke, so concurrent
+    # read-only calls can overlap their file I/O
+    try:
+        result_content = await tool_function.ainvoke(tool_args)
+    finally:
+        if cache is not None and cache_key is None:
+            cache.end_mutation()
+    # Error strings aren't cached: the next attempt may well succeed
+    if cache_key is not None and isinstance(result_content, str) and not result_content.startswith("Error"):
+        cache.set(cache_key, result_content, started_epoch)
+    logger.info("✅ Tool %s executed successfully", tool_name)
+    return result_content
+
+def _interpret_tool_outcome(tool_name: str, tool_id: str, outcome: Any) -> tuple[str, Dict[str, Any] | None]:
+    """Turn a raw tool outcome into (content for the LLM, structured result or None).
+
+    Structured results are the JSON dicts returned by the file tools; they get
+    the tool_call_id added for frontend tracking.
+    """
+    if isinstance(outcome, BaseException):
+        return f"Tool {tool_name} failed: {str(outcome)}", None
+    if outcome is None:
+        return f"Unknown tool: {tool_name}", None
+
+    # Try to parse the result as JSON for file/terminal operations. Only the
+    # structured results start with "{", so plain text (file reads, listings)
+    # is not run through the parser at all.
+    result_data = None
+    if isinstance(outcome, str) and outcome.startswith("{"):
+        try:
+            result_data = orjson.loads(outcome)
+        except orjson.JSONDecodeError:
+            pass
+    if not (isinstance(result_data, dict) and "success" in result_data):
+        # This is a simple string result from other tools (e.g., list_directory)
+        return outcome, None
+
+    result_data["tool_call_id"] = tool_id
+    # The message for the LLM should be the summary message
+    return result_data.get("message", "Operation successful."), result_data
+
+# Queue that receives (tool_call_id, interpreted outcome) as each tool call
+# finishes. Set by the runner to stream results in completion order.
+_tool_result_sink: contextvars.ContextVar["asyncio.Queue[tuple[str, tuple[str, Dict[str, Any] | None]] | None] | None"] = contextvars.ContextVar("_tool_result_sink", default=None)
+
+async def _invoke_and_report(tool_name: str, tool_args: Dict[str, Any], tool_id: str):
+    """Run one tool call and report its interpreted outcome to the result sink, if any."""
+    try:
+        outcome = await _invoke_tool(tool_name, tool_args)
+    except Exception as e:
+        outcome = e
+    interpreted = _interpret_tool_outcome(tool_name, tool_id, outcome)
+    if (sink := _tool_result_sink.get()) is not None:
+        sink.put_nowait((tool_id, interpreted))
+    return outcome, interpreted
+
+RECENT_FILES_LIMIT = 10
+
+def _update_recent_files(recent_files: List[str], touched: List[str]) -> List[str]:
+    """Move touched paths to the end of recent_files, keeping the newest RECENT_FILES_LIMIT."""
+    if not touched:
+        return recent_files
+    # dict keeps insertion order, so it doubles as an O(1) ordered set
+    ordered = dict.fromkeys(recent_files)
+    for path in touched:
+        ordered.pop(path, None)
+        ordered[path] = None
+    return list(ordered)[-RECENT_FILES_LIMIT:]
+
+# Arguments that can carry whole files (write_file, find_and_replace_in_file)
+_LARGE_TEXT_ARGS = frozenset({"content", "find_text", "replace_text"})
+
+def _tool_signature(tool_name: str, tool_args: Dict[str, Any]) -> str:
+    """Dedup key for a tool call: the tool name plus a digest of its canonical arguments."""
+    # Hash file-sized strings directly rather than JSON-escaping them first
+    args = {
+        key: hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+        if key in _LARGE_TEXT_ARGS and isinstance(value, str) else value
+        for key, value in tool_args.items()
+    }
+    canonical = orjson.dumps(args, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return f"{tool_name}:{hashlib.blake2b(canonical, digest_size=16).hexdigest()}"
+
+MAX_TOTAL_TOOL_CALLS = 15  # Prevent infinite loops
+
+async def tool_executor_node(state: MultiAgentState):
+    """Executes tool calls concurrently and returns results in call order."""
     if not state["messages"]:
         return state
     
@@ -748,7 +1428,7 @@ def tool_executor_node(state: MultiAgentState):
     if not isinstance(last_message, AIMessage) or not hasattr(last_message, 'tool_calls') or not last_message.tool_calls:
         return state
 
-    logger.info(f"🔧 Tool executor processing {len(last_message.tool_calls)} tool calls")
+    logger.info("🔧 Tool executor processing %d tool calls", len(last_message.tool_calls))
 
     # Initialize state fields if they don't exist
     state.setdefault("tool_call_count", 0)
@@ -757,12 +1437,12 @@ def tool_executor_node(state: MultiAgentState):
     
     # These will hold events generated ONLY during this execution run
     new_file_operation_events = []
+    touched_files = []
     new_terminal_events = []
 
     # Check total tool call limit
-    MAX_TOTAL_TOOL_CALLS = 15  # Prevent infinite loops
     if state["tool_call_count"] >= MAX_TOTAL_TOOL_CALLS:
-        logger.warning(f"⚠️ Reached maximum tool calls limit ({MAX_TOTAL_TOOL_CALLS})")
+        logger.warning("⚠️ Reached maximum tool calls limit (%d)", MAX_TOTAL_TOOL_CALLS)
         return {
             "messages": [AIMessage(content=f"I've reached the maximum number of tool calls ({MAX_TOTAL_TOOL_CALLS}) for this session. Please start a new conversation if you need more operations.")]
         }
@@ -770,6 +1450,7 @@ def tool_executor_node(state: MultiAgentState):
     # Process all tool calls and collect results
     tool_results = []
     all_tool_call_details = []  # For comprehensive logging
+    planned_calls = []
     
     for i, tool_call in enumerate(last_message.tool_calls):
         tool_name = tool_call.get('name', 'unknown')
@@ -777,10 +1458,10 @@ def tool_executor_node(state: MultiAgentState):
         tool_id = tool_call.get('id', f'tool_{i}')
         
         # Log detailed tool call information
-        logger.info(f"🔧 Tool Call {i+1}/{len(last_message.tool_calls)}:")
-        logger.info(f"  Tool: {tool_name}")
-        logger.info(f"  ID: {tool_id}")
-        logger.info(f"  Arguments: {json.dumps(tool_args, indent=2)}")
+        logger.info("🔧 Tool Call %d/%d: %s (ID: %s)", i + 1, len(last_message.tool_calls), tool_name, tool_id)
+        # Arguments can hold whole file bodies, so they are only dumped at DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("  Arguments: %s", orjson.dumps(tool_args, option=orjson.OPT_INDENT_2, default=str).decode())
         
         all_tool_call_details.append({
             "tool_name": tool_name,
@@ -791,81 +1472,63 @@ def tool_executor_node(state: MultiAgentState):
         })
 
         # Create tool call signature for deduplication
-        tool_signature = f"{tool_name}:{json.dumps(tool_args, sort_keys=True)}"
+        tool_signature = _tool_signature(tool_name, tool_args)
         
         # Check failure count for this specific tool+args combination
-        failure_key = tool_signature
-        failure_count = state["tool_failures"].get(failure_key, 0)
-        
+        failure_count = state["tool_failures"].get(tool_signature, 0)
         if failure_count >= 3:
-            logger.warning(f"⚠️ Skipping failed tool: {tool_name} (failed {failure_count} times)")
-            result_content = f"Tool {tool_name} has failed too many times with these arguments and has been disabled."
+            logger.warning("⚠️ Skipping failed tool: %s (failed %d times)", tool_name, failure_count)
+        planned_calls.append((tool_name, tool_args, tool_id, tool_signature, failure_count))
+
+    runnable_calls = [
+        (tool_name, tool_args, tool_id)
+        for tool_name, tool_args, tool_id, _, failure_count in planned_calls
+        if failure_count < 3
+    ]
+    parallel = state.get("parallel_tool_calls", PARALLEL_TOOL_CALLS)
+    slots = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS)
+
+    async def run_call(call):
+        async with slots:
+            return await _invoke_and_report(*call)
+
+    results = []
+    # Only runs of consecutive read-only calls execute concurrently. Every
+    # mutating call waits for the calls before it and finishes before the next
+    # one starts, so edits to one file can't overwrite each other and a command
+    # always sees the files written ahead of it. gather keeps call order.
+    for read_only, group in itertools.groupby(runnable_calls, key=lambda call: call[0] in _READ_ONLY_TOOLS):
+        if read_only and parallel:
+            results.extend(await asyncio.gather(*(run_call(call) for call in group)))
         else:
-            # Execute the tool
-            try:
-                # Get the actual tool function
-                available_tools = {
-                    "write_file": write_file,
-                    "read_file": read_file,
-                    "find_and_replace_in_file": find_and_replace_in_file,
-                    "list_directory": list_directory,
-                    "execute_bash_command": execute_bash_command
-                }
-
-                # Add PLANNER tools if available
-                try:
-                    from planner_node import (
-                        read_file as planner_read_file,
-                        list_directory as planner_list_directory,
-                        execute_safe_bash
-                    )
-                    available_tools.update({
-                        "execute_safe_bash": execute_safe_bash
-                    })
-                    # Note: PLANNER uses same names for read_file and list_directory
-                    # but with different implementations, so we keep the original ones
-                except ImportError:
-                    logger.warning("PLANNER tools not available for tool execution")
-                
-                if tool_name in available_tools:
-                    # No longer need to pre-read files here, the tool handles it
-                    tool_function = available_tools[tool_name]
-                    result_content = tool_function.invoke(tool_args)
-                    logger.info(f"✅ Tool {tool_name} executed successfully")
-                    
-                    # Try to parse the result as JSON for file/terminal operations
-                    try:
-                        result_data = json.loads(result_content)
-                        is_structured_result = isinstance(result_data, dict) and "success" in result_data
-                    except (json.JSONDecodeError, TypeError):
-                        is_structured_result = False
-
-                    if is_structured_result:
-                        # This is a structured result from a file or terminal tool
-                        # Add tool_call_id for frontend tracking
-                        result_data["tool_call_id"] = tool_id
-                        
-                        if result_data.get("operation"): # File operation
-                             new_file_operation_events.append({ "type": "file_operation", **result_data })
-                        elif result_data.get("command"): # Terminal operation
-                            new_terminal_events.append({ "type": "terminal", **result_data })
-                        
-                        # The message for the LLM should be the summary message
-                        result_content_for_llm = result_data.get("message", "Operation successful.")
-                    else:
-                        # This is a simple string result from other tools (e.g., list_directory)
-                        result_content_for_llm = result_content
-
-                else:
-                    result_content_for_llm = f"Unknown tool: {tool_name}"
-                    logger.error(f"❌ Unknown tool: {tool_name}")
-                    
-            except Exception as e:
-                logger.error(f"❌ Tool {tool_name} failed with error: {str(e)}")
-                result_content_for_llm = f"Tool {tool_name} failed: {str(e)}"
-                
+            results.extend([await _invoke_and_report(*call) for call in group])
+    outcomes = iter(results)
+
+    # All calls of this turn have finished, so they share one timestamp
+    executed_at = datetime.now().isoformat()
+    success_by_id: Dict[str, bool] = {}
+    for tool_name, tool_args, tool_id, tool_signature, failure_count in planned_calls:
+        if failure_count >= 3:
+            result_content_for_llm = f"Tool {tool_name} has failed too many times with these arguments and has been disabled."
+            success = False
+        else:
+            outcome, (result_content_for_llm, result_data) = next(outcomes)
+            # Judge success from the outcome itself rather than scanning the output text
+            success = outcome is not None and not isinstance(outcome, BaseException)
+            if isinstance(outcome, BaseException):
+                logger.error("❌ Tool %s failed with error: %s", tool_name, outcome)
                 # Increment failure count
-                state["tool_failures"][failure_key] = failure_count + 1
+                state["tool_failures"][tool_signature] = failure_count + 1
+            elif outcome is None:
+                logger.error("❌ Unknown tool: %s", tool_name)
+            elif result_data is not None:
+                success = bool(result_data.get("success", True))
+                if result_data.get("operation"): # File operation
+                     new_file_operation_events.append({ "type": "file_operation", **result_data })
+                     if result_data.get("file_path"):
+                         touched_files.append(result_data["file_path"])
+                elif result_data.get("command"): # Terminal operation
+                    new_terminal_events.append({ "type": "terminal", **result_data })
 
         # Create tool result message
         tool_message = ToolMessage(
@@ -873,29 +1536,34 @@ def tool_executor_node(state: MultiAgentState):
             tool_call_id=tool_id
         )
         tool_results.append(tool_message)
+        success_by_id[tool_id] = success
         
         # Track this tool call
         state["tool_call_history"].append({
             "signature": tool_signature,
             "tool_name": tool_name,
-            "timestamp": datetime.now().isoformat(),
-            "success": "failed" not in result_content_for_llm.lower()
+            "timestamp": executed_at,
+            "success": success
         })
         
         # Increment total tool call count
         state["tool_call_count"] += 1
 
     # Log summary of all tool calls processed
-    logger.info(f"🔧 Completed processing {len(last_message.tool_calls)} tool calls:")
-    for detail in all_tool_call_details:
-        logger.info(f"  {detail['call_index']}/{detail['total_calls']}: {detail['tool_name']} -> {'✅' if any('failed' not in msg.content.lower() for msg in tool_results if hasattr(msg, 'tool_call_id') and msg.tool_call_id == detail['tool_id']) else '❌'}")
+    if logger.isEnabledFor(logging.INFO):
+        summary = "\n".join(
+            f"  {detail['call_index']}/{detail['total_calls']}: {detail['tool_name']} -> "
+            f"{'✅' if success_by_id.get(detail['tool_id']) else '❌'}"
+            for detail in all_tool_call_details
+        )
+        logger.info("🔧 Completed processing %d tool calls:\n%s", len(last_message.tool_calls), summary)
 
     return {
         "messages": tool_results,
         "tool_call_count": state["tool_call_count"],
         "tool_call_history": state["tool_call_history"],
         "tool_failures": state["tool_failures"],
-        "recent_files": state.get("recent_files", []),
+        "recent_files": _update_recent_files(state.get("recent_files", []), touched_files),
         "file_operation_events": new_file_operation_events,
         "terminal_events": new_terminal_events,
     }
@@ -924,8 +1592,13 @@ def should_continue(state: MultiAgentState) -> Literal["execute_tools", "__end__
 
 # --- Build the Graph ---
 
-def create_multi_agent_graph():
-    """Creates and returns the multi-agent workflow graph."""
+def create_multi_agent_graph(checkpointer=None):
+    """Creates and returns the multi-agent workflow graph.
+
+    Pass a LangGraph checkpointer (e.g. AsyncSqliteSaver from the
+    langgraph-checkpoint-sqlite package) to persist state per thread_id, so a
+    run can be resumed by loading its checkpoint instead of replaying history.
+    """
     workflow = StateGraph(MultiAgentState)
 
     # Add nodes
@@ -968,17 +1641,138 @@ def create_multi_agent_graph():
         }
     )
 
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
 # --- API Interface ---
 
-def run_multi_agent_query_stream(messages: List[Dict[str, Any]]):
+async def _run_with_tool_result_sink(state: MultiAgentState, sink: asyncio.Queue):
+    """Run the tool executor with `sink` receiving each result as it finishes, then a None sentinel."""
+    _tool_result_sink.set(sink)
+    try:
+        return await tool_executor_node(state)
+    finally:
+        sink.put_nowait(None)
+
+def _turn_digest(message: AIMessage) -> str:
+    """Digest of an expert turn's text and tool calls (names and args, not ids)."""
+    payload = [str(message.content), [(tool_call["name"], tool_call["args"]) for tool_call in message.tool_calls]]
+    return hashlib.blake2b(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS, default=str), digest_size=16).hexdigest()
+
+def _stop_message(message_id: str, expert: str, expert_icon: str, content: str) -> Dict[str, Any]:
+    """Agent message event for a run that ends without a final expert answer."""
+    return {
+        "type": "message",
+        "message": {
+            "id": message_id,
+            "type": "agent",
+            "content": content,
+            "expert": expert,
+            "expert_icon": expert_icon,
+            "timestamp": datetime.now().isoformat(),
+        }
+    }
+
+def _build_tool_event(tool_call: Dict[str, Any] | None, tool_result_content: Any, result_data: Dict[str, Any] | None, prompt_snapshot: Any) -> Dict[str, Any] | None:
+    """Frontend event for one finished tool call, or None if the call has nothing to display."""
+    if tool_call is None:
+        return None
+    tool_name = tool_call["name"]
+    tool_args = tool_call["args"]
+
+    # Determine if this is a file operation or terminal tool
+    if tool_name in ["write_file", "find_and_replace_in_file"]:
+        if result_data is None or not result_data.get("operation"):
+            return None
+        event_type = "file_operation"
+    elif tool_name in ["execute_bash_command", "execute_safe_bash"]:
+        if result_data is None or not result_data.get("command"):
+            return None
+        event_type = "terminal"
+    else:
+        # For other tools, create a generic tool call event
+        return {
+            "type": "tool_call",
+            "tool_call_id": tool_call["id"],
+            "tool_name": tool_name,
+            "command": f"{tool_name}({', '.join(f'{k}={v}' for k, v in tool_args.items())})",
+            "result": tool_result_content,
+            "success": "error" not in str(tool_result_content).lower(),
+            "timestamp": datetime.now().isoformat(),
+            "prompt": prompt_snapshot,
+            "tool_args": tool_args
+        }
+
+    # Enhanced file operation / terminal event with prompt and args
+    return {
+        "type": event_type,
+        **result_data,
+        "prompt": prompt_snapshot,
+        "tool_args": tool_args,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+_EXPERT_NODES = {
+    "CodeGenerator": code_generator_node,
+    "CodeReviewer": code_reviewer_node,
+    "Planner": planner_node,
+}
+
+# Set HEDGED_EXPERT_RACE=1 to run the first turn of both the Code Generator and
+# the Code Reviewer when the routing LLM picked one of them, keeping whichever
+# answers first. Costs one extra LLM call per hedged query.
+HEDGED_EXPERT_RACE = os.getenv("HEDGED_EXPERT_RACE", "0") == "1"
+_HEDGED_EXPERTS = ("CodeGenerator", "CodeReviewer")
+
+async def _race_experts(state: MultiAgentState, routed_expert: str) -> tuple[str, Dict[str, Any] | None]:
+    """Run the hedged experts' first turn concurrently; return the first successful one.
+
+    Only the LLM calls race. Tool calls are executed afterwards for the winner
+    alone, so the loser has no side effects. Falls back to the routed expert's
+    result if every expert errored.
+    """
+    tasks = {asyncio.create_task(_EXPERT_NODES[name](state)): name for name in _HEDGED_EXPERTS}
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    continue
+                name, result = tasks[task], task.result()
+                results[name] = result
+                if not any("error" in info for info in result.get("debug_info", [])):
+                    logger.info("🏁 Hedged race won by %s (routed to %s)", name, routed_expert)
+                    return name, result
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if routed_expert in results:
+        return routed_expert, results[routed_expert]
+    # Every hedged node raised; let the normal loop run the routed expert
+    return routed_expert, None
+
+async def _run_with_token_sink(node, state: MultiAgentState, sink: "asyncio.Queue[str | None]"):
+    """Run an expert node with `sink` receiving its token deltas, then a None sentinel."""
+    # Runs as its own task, so setting the context var here doesn't leak to the caller
+    _token_sink.set(sink)
+    try:
+        return await node(state)
+    finally:
+        sink.put_nowait(None)
+
+async def run_multi_agent_query_stream_async(messages: List[Dict[str, Any]], model: str | None = None, batch_tool_events: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
     """
     Streams messages from the multi-agent system in real-time.
     This is the single entry point for running queries.
+    `model` overrides LLM_MODEL for this query only.
+    With `batch_tool_events`, tool results that finish together are sent as one
+    {"type": "messages_batch", "messages": [...]} event instead of one each;
+    results are never held back waiting for slower calls.
     """
     query_text = messages[-1].get('content', '')[:100] if messages else "Unknown query"
-    logger.info(f"🚀 Starting multi-agent query stream processing: '{query_text}...'")
+    logger.info("🚀 Starting multi-agent query stream processing: '%s...'", query_text)
     
     # Convert dicts from session history into LangChain message objects
     langchain_messages = []
@@ -1008,18 +1802,24 @@ def run_multi_agent_query_stream(messages: List[Dict[str, Any]]):
         "tool_call_history": [],
         "recent_files": [],
         "file_operation_events": [],
-        "terminal_events": []
+        "terminal_events": [],
+        "model_name": model or DEFAULT_LLM_MODEL,
+        "parallel_tool_calls": PARALLEL_TOOL_CALLS,
     }
     
-    # helper for unique ids
+    # helper for unique ids: one random prefix per stream plus a counter, so
+    # only the prefix needs fresh entropy
+    id_prefix = f"msg-{uuid.uuid4().hex[:16]}"
+    id_counter = itertools.count(1)
+
     def _new_id() -> str:
-        return f"msg-{uuid.uuid4().hex}"
+        return f"{id_prefix}-{next(id_counter)}"
 
     message_counter = 0
     
     # Step 1: Coordinator routing
     logger.info("🎯 Step 1: Coordinator routing")
-    coordinator_result = coordinator_node(state)
+    coordinator_result = await coordinator_node(state)
     
     if "current_expert" in coordinator_result:
         expert_used = coordinator_result["current_expert"]
@@ -1033,7 +1833,7 @@ def run_multi_agent_query_stream(messages: List[Dict[str, Any]]):
             if coordinator_result["debug_info"] and "prompt" in coordinator_result["debug_info"][0]:
                 coordinator_prompt = coordinator_result["debug_info"][0]["prompt"]
         
-        expert_icon = EXPERT_DEFINITIONS.get(expert_used, {}).get("icon", "🤖")
+        expert_icon = EXPERT_ICONS.get(expert_used, "🤖")
         
         message_counter += 1
         yield {
@@ -1050,29 +1850,62 @@ def run_multi_agent_query_stream(messages: List[Dict[str, Any]]):
         }
     else:
         expert_used = "CodeGenerator"
-        expert_icon = EXPERT_DEFINITIONS.get(expert_used, {}).get("icon", "🤖")
+        expert_icon = EXPERT_ICONS.get(expert_used, "🤖")
     
+    # Optionally hedge an LLM-chosen Generator/Reviewer route by racing both
+    # experts' first turn; keyword and cached routes are trusted as-is
+    raced_result = None
+    route_source = (coordinator_result.get("debug_info") or [{}])[0].get("source")
+    if HEDGED_EXPERT_RACE and route_source == "llm" and expert_used in _HEDGED_EXPERTS:
+        expert_used, raced_result = await _race_experts(state, expert_used)
+        state["current_expert"] = expert_used
+        expert_icon = EXPERT_ICONS.get(expert_used, "🤖")
+
     # Step 2: Execute expert node
-    logger.info(f"⚡ Step 2: Executing {expert_used}")
+    logger.info("⚡ Step 2: Executing %s", expert_used)
     
     max_iterations = 10
     iteration = 0
+    # Digest of the previous tool-calling turn, to detect an expert stuck on one step.
+    # Only back-to-back repeats count: re-running tests after an edit, or re-reading
+    # a file that was just changed, repeats an earlier turn but is progress.
+    prev_digest: str | None = None
     
     while iteration < max_iterations:
         iteration += 1
-        logger.info(f"🔄 Iteration {iteration}")
         
-        # Execute the appropriate expert
-        if expert_used == "CodeGenerator":
-            expert_result = code_generator_node(state)
-        elif expert_used == "CodeReviewer":
-            expert_result = code_reviewer_node(state)
-        else:  # Planner
-            expert_result = planner_node(state)
+        stream_id = _new_id()
+        # Text streamed under stream_id this turn, so a tool-calling turn can
+        # close its draft with exactly what the client has shown
+        streamed: List[str] = []
+        if raced_result is not None:
+            # The hedged race already produced this turn's response
+            expert_result, raced_result = raced_result, None
+        else:
+            # Execute the appropriate expert, forwarding its tokens as they arrive
+            expert_node = _EXPERT_NODES.get(expert_used, planner_node)
+            tokens: asyncio.Queue[str | None] = asyncio.Queue()
+            node_task = asyncio.create_task(_run_with_token_sink(expert_node, state, tokens))
+            try:
+                while (delta := await tokens.get()) is not None:
+                    streamed.append(delta)
+                    yield {
+                        "type": "token",
+                        "message_id": stream_id,
+                        "content": delta,
+                        "expert": expert_used,
+                        "expert_icon": expert_icon,
+                    }
+                expert_result = await node_task
+            finally:
+                # Client went away mid-stream: stop the LLM call too
+                if not node_task.done():
+                    node_task.cancel()
         
         # Update state with expert result
         if "messages" in expert_result:
-            state["messages"] = state["messages"] + expert_result["messages"]
+            # The runner owns this list, so append in place instead of copying the history
+            state["messages"].extend(expert_result["messages"])
             
             # Extract prompt snapshot for this LLM call (for frontend display)
             prompt_snapshot = None
@@ -1081,106 +1914,148 @@ def run_multi_agent_query_stream(messages: List[Dict[str, Any]]):
 
             # Check the last message for tool calls or text response
             last_msg = expert_result["messages"][-1]
+            # One record per iteration, formatted only if INFO is enabled
+            logger.info(
+                "🔄 Iteration %d: %s, %d tool call(s)", iteration, expert_used,
+                len(getattr(last_msg, "tool_calls", None) or ()),
+            )
             if isinstance(last_msg, AIMessage):
                 # If AI wants to call tools
                 if last_msg.tool_calls:
-                    # Execute tools first
+                    # Text streamed ahead of the tool calls left a draft bubble
+                    # under stream_id; finalize it so it is also saved with the session
+                    if preamble := "".join(streamed).strip():
+                        message_counter += 1
+                        yield {
+                            "type": "message",
+                            "message": {
+                                "id": stream_id,
+                                "type": "agent",
+                                "content": preamble,
+                                "expert": expert_used,
+                                "expert_icon": expert_icon,
+                                "timestamp": datetime.now().isoformat(),
+                                "prompt": prompt_snapshot
+                            }
+                        }
+
+                    # Repeating the previous turn verbatim would only replay its tool
+                    # results, so stop instead of paying for more identical rounds
+                    turn_digest = _turn_digest(last_msg)
+                    if turn_digest == prev_digest:
+                        logger.warning("⚠️ %s repeated its previous tool-calling turn; stopping at iteration %d", expert_used, iteration)
+                        yield _stop_message(
+                            _new_id(), expert_used, expert_icon,
+                            "⚠️ Stopped early: the same tool calls were repeated without making progress."
+                        )
+                        break
+                    prev_digest = turn_digest
+
+                    # Announce the whole batch up front, then stream each result
+                    # as soon as its tool finishes (completion order)
                     logger.info("🔧 Executing tools")
-                    tool_result = tool_executor_node(state)
+                    calls_by_id = {tool_call["id"]: tool_call for tool_call in last_msg.tool_calls}
+                    yield {
+                        "type": "tool_calls_started",
+                        "tool_calls": [
+                            {"id": tool_call["id"], "name": tool_call["name"], "args": tool_call["args"]}
+                            for tool_call in last_msg.tool_calls
+                        ],
+                        "timestamp": datetime.now().isoformat(),
+                    }
 
-                    # Update state with tool results
-                    if "messages" in tool_result:
-                        state["messages"] = state["messages"] + tool_result["messages"]
-
-                        # Create combined tool call events for each tool
-                        for i, tool_call in enumerate(last_msg.tool_calls):
-                            tool_name = tool_call["name"]
-                            tool_args = tool_call["args"]
-                            tool_id = tool_call["id"]
-
-                            # Find the corresponding tool result
-                            tool_result_content = ""
-                            for tool_msg in tool_result["messages"]:
-                                if isinstance(tool_msg, ToolMessage) and tool_msg.tool_call_id == tool_id:
-                                    tool_result_content = tool_msg.content
+                    tool_events: List[Dict[str, Any]] = []
+                    reported_ids = set()
+                    results: asyncio.Queue = asyncio.Queue()
+                    executor_task = asyncio.create_task(_run_with_tool_result_sink(state, results))
+                    try:
+                        finished = False
+                        while not finished:
+                            # Wait for the next result; when batching, also take the
+                            # ones that finished alongside it, but never wait for more
+                            ready = []
+                            item = await results.get()
+                            while item is not None:
+                                ready.append(item)
+                                if not batch_tool_events or results.empty():
                                     break
-
-                            # Determine if this is a file operation or terminal tool
-                            if tool_name in ["write_file", "find_and_replace_in_file"]:
-                                # Find the corresponding file event from the new events
-                                file_event = None
-                                file_events_list = cast(List[Dict[str, Any]], tool_result.get("file_operation_events", []))
-                                for ev in file_events_list:
-                                    if ev.get("tool_call_id") == tool_id:
-                                        file_event = ev
-                                        break
-
-                                if file_event:
-                                    message_counter += 1
-                                    # Create enhanced file operation event with prompt and args
-                                    enhanced_event = dict(file_event)
-                                    enhanced_event["prompt"] = prompt_snapshot
-                                    enhanced_event["tool_args"] = tool_args
-                                    enhanced_event["timestamp"] = datetime.now().isoformat()
-                                    yield enhanced_event
-
-                            elif tool_name in ["execute_bash_command", "execute_safe_bash"]:
-                                # Find the corresponding terminal event from the new events
-                                terminal_event = None
-                                terminal_events_list = cast(List[Dict[str, Any]], tool_result.get("terminal_events", []))
-                                for ev in terminal_events_list:
-                                    if ev.get("tool_call_id") == tool_id:
-                                        terminal_event = ev
-                                        break
-
-                                if terminal_event:
-                                    message_counter += 1
-                                    # Create enhanced terminal event with prompt and args
-                                    enhanced_event = dict(terminal_event)
-                                    enhanced_event["prompt"] = prompt_snapshot
-                                    enhanced_event["tool_args"] = tool_args
-                                    enhanced_event["timestamp"] = datetime.now().isoformat()
-                                    yield enhanced_event
-
+                                item = results.get_nowait()
                             else:
-                                # For other tools, create a generic tool call event
+                                finished = True
+
+                            for tool_id, (tool_result_content, result_data) in ready:
+                                reported_ids.add(tool_id)
+                                tool_event = _build_tool_event(calls_by_id.get(tool_id), tool_result_content, result_data, prompt_snapshot)
+                                if tool_event is not None:
+                                    tool_events.append(tool_event)
+                            if batch_tool_events and len(tool_events) > 1:
+                                yield {"type": "messages_batch", "messages": tool_events}
+                            else:
+                                for tool_event in tool_events:
+                                    message_counter += 1
+                                    yield tool_event
+                            tool_events = []
+                        tool_result = await executor_task
+                    finally:
+                        # Client went away mid-stream: stop the remaining tools too
+                        if not executor_task.done():
+                            executor_task.cancel()
+
+                    # Update state with tool results; ToolMessages stay in call order
+                    if "messages" in tool_result:
+                        state["messages"].extend(tool_result["messages"])
+
+                        # Calls skipped for repeated failures never ran, so they are
+                        # reported from their ToolMessage instead. The executor builds
+                        # these messages itself, so an exact type check is enough.
+                        for tool_msg in tool_result["messages"]:
+                            if type(tool_msg) is ToolMessage and tool_msg.tool_call_id not in reported_ids:
+                                tool_event = _build_tool_event(calls_by_id.get(tool_msg.tool_call_id), tool_msg.content, None, prompt_snapshot)
+                                if tool_event is not None:
+                                    tool_events.append(tool_event)
+
+                        if batch_tool_events and len(tool_events) > 1:
+                            yield {"type": "messages_batch", "messages": tool_events}
+                        else:
+                            for tool_event in tool_events:
                                 message_counter += 1
-                                yield {
-                                    "type": "tool_call",
-                                    "tool_name": tool_name,
-                                    "command": f"{tool_name}({', '.join(f'{k}={v}' for k, v in tool_args.items())})",
-                                    "result": tool_result_content,
-                                    "success": "error" not in str(tool_result_content).lower(),
-                                    "timestamp": datetime.now().isoformat(),
-                                    "prompt": prompt_snapshot,
-                                    "tool_args": tool_args
-                                }
-                    
-                    # Update other state fields safely
-                    for key in ["tool_failures", "tool_call_count", "tool_call_history", "recent_files"]:
-                        if key in tool_result:
-                            state[key] = tool_result[key]
-                    
-                    # Manually update the state's event history with the new events
-                    if "file_operation_events" in tool_result:
-                        events_to_add = cast(List[Dict[str, Any]], tool_result["file_operation_events"])
-                        state.get("file_operation_events", []).extend(events_to_add)
-                    if "terminal_events" in tool_result:
-                        events_to_add = cast(List[Dict[str, Any]], tool_result["terminal_events"])
-                        state.get("terminal_events", []).extend(events_to_add)
+                                yield tool_event
+
+                        # Sending a burst of tool events rarely suspends, so give
+                        # other streams a turn on the loop before the next LLM call
+                        if len(last_msg.tool_calls) > 1:
+                            await asyncio.sleep(0)
                     
+                    # Once the tool budget is spent the executor answers with an
+                    # AIMessage instead of tool results; relay it and stop rather
+                    # than asking the expert again
+                    budget_reply = next((m for m in tool_result.get("messages", []) if type(m) is AIMessage), None)
+                    if budget_reply is not None:
+                        yield _stop_message(_new_id(), expert_used, expert_icon, str(budget_reply.content))
+                        break
+
+                    # Any other executor result carries the full update, and the
+                    # event lists were created with the initial state
+                    state["tool_failures"] = tool_result["tool_failures"]
+                    state["tool_call_count"] = tool_result["tool_call_count"]
+                    state["tool_call_history"] = tool_result["tool_call_history"]
+                    state["recent_files"] = tool_result["recent_files"]
+                    state["file_operation_events"].extend(tool_result["file_operation_events"])
+                    state["terminal_events"].extend(tool_result["terminal_events"])
+
                     # Continue to next iteration for AI to process tool results
                     continue
                 
                 # If AI has text response (no tool calls), we're done
-                elif str(last_msg.content).strip():
+                elif final_text := str(last_msg.content).strip():
                     message_counter += 1
                     yield {
                         "type": "message",
                         "message": {
-                            "id": _new_id(),
+                            # Same id as the token events, so the client replaces its draft
+                            "id": stream_id,
                             "type": "agent",
-                            "content": str(last_msg.content).strip(),
+                            "content": final_text,
                             "expert": expert_used,
                             "expert_icon": expert_icon,
                             "timestamp": datetime.now().isoformat(),
@@ -1193,13 +2068,44 @@ def run_multi_agent_query_stream(messages: List[Dict[str, Any]]):
         break
     
     # Send completion event
-    logger.info(f"✅ Multi-agent query stream completed successfully, expert used: {expert_used}")
+    logger.info("✅ Multi-agent query stream completed successfully, expert used: %s", expert_used)
     yield {
         "type": "complete",
         "expert_used": expert_used,
         "timestamp": datetime.now().isoformat()
     }
 
+# Event loop used by the sync wrapper. It is reused across calls because the
+# shared async HTTP client's pooled connections are bound to one loop.
+_sync_stream_loop: asyncio.AbstractEventLoop | None = None
+
+def run_multi_agent_query_stream(messages: List[Dict[str, Any]], model: str | None = None):
+    """
+    Synchronous wrapper around run_multi_agent_query_stream_async for the CLI
+    and scripts that are not running inside an event loop.
+    """
+    global _sync_stream_loop
+    if _sync_stream_loop is None or _sync_stream_loop.is_closed():
+        _sync_stream_loop = asyncio.new_event_loop()
+
+    stream = run_multi_agent_query_stream_async(messages, model=model)
+    try:
+        while True:
+            try:
+                yield _sync_stream_loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        _sync_stream_loop.run_until_complete(stream.aclose())
+
+def _close_sync_stream_loop():
+    """atexit hook: close the async client's connections on the loop they belong to, then the loop."""
+    if _sync_stream_loop is not None and not _sync_stream_loop.is_closed():
+        _sync_stream_loop.run_until_complete(aclose_shared_http_clients())
+        _sync_stream_loop.close()
+
+atexit.register(_close_sync_stream_loop)
+
 # --- Command Line Interface ---
 
 if __name__ == "__main__":
@@ -1238,27 +2144,40 @@ if __name__ == "__main__":
     output_file = os.path.join(OUTPUT_DIR, "binary_search.py")
     if os.path.exists(output_file):
         print(f"✅ Verification: File '{output_file}' was created.")
-        with open(output_file, 'r') as f:
-            print("--- File Content ---")
-            print(f.read(200) + "...")
-            print("--------------------")
+        # One unbuffered read of the head; only mark truncation if there is more
+        with open(output_file, 'rb', buffering=0) as f:
+            head = f.read(200)
+        print("--- File Content ---")
+        print(head.decode("utf-8", errors="replace") + ("..." if len(head) == 200 else ""))
+        print("--------------------")
     else:
         print(f"❌ Verification: File '{output_file}' was NOT created.") 
 
 # NEW: helper to ensure Anthropic compatibility --------------------------------
 
+def _is_blank_assistant(m: BaseMessage) -> bool:
+    """True for an AIMessage whose content is empty or whitespace only."""
+    if not isinstance(m, AIMessage):
+        return False
+    # Same test as `not content.strip()`, but isspace() stops at the first
+    # visible character instead of copying the whole message
+    content = str(m.content)
+    return not content or content.isspace()
+
 def _ensure_nonempty_assistant(msgs: list[BaseMessage]) -> list[BaseMessage]:
-    """Return a copy of msgs where any assistant/AIMessage with empty content
-    is given a single placeholder character. This is only used when sending
+    """Return msgs with any assistant/AIMessage that has empty content
+    given a single placeholder character. This is only used when sending
     to Anthropic models; it does **NOT** modify the objects held in session,
     so frontend still receives the original content (possibly empty).
+    The list is only copied if a message actually needs fixing; otherwise
+    msgs itself is returned.
     """
-    fixed: list[BaseMessage] = []
-    for m in msgs:
-        if isinstance(m, AIMessage) and not str(m.content).strip():
-            fixed.append(AIMessage(content=".", tool_calls=getattr(m, "tool_calls", None), id=getattr(m, "id", None)))
-        else:
-            fixed.append(m)
-    return fixed
+    if not any(map(_is_blank_assistant, msgs)):
+        return msgs
+    return [
+        # Shallow copy without re-validation; tool_calls and id carry over
+        m.model_copy(update={"content": "."}) if _is_blank_assistant(m) else m
+        for m in msgs
+    ]
 
 # ------------------------------------------------------------------------------ 
\ No newline at end of file
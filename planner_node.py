@@ -12,6 +12,7 @@ This module implements a specialized PLANNER node that can:
 from typing import TypedDict, Annotated, List, Dict, Any, Optional
 import operator
 import os
+import asyncio
 import subprocess
 import logging
 import json
@@ -19,8 +20,7 @@ import re
 from pathlib import Path
 from datetime import datetime
 from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage, SystemMessage
-from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
+from langchain_core.tools import tool, StructuredTool
 from pydantic import SecretStr
 
 # Configure logging
@@ -34,6 +34,9 @@ PLANNER_DEFINITION = {
     "tools": ["read_file", "list_directory", "execute_safe_bash"]
 }
 
+# read_file truncates longer files for planning analysis
+PLANNER_MAX_FILE_CHARS = 10000
+
 # Whitelist of safe bash commands for PLANNER
 SAFE_BASH_COMMANDS = {
     # File and directory operations (read-only)
@@ -79,14 +82,13 @@ def _get_safe_path(file_path: str, base_dir: Optional[Path] = None) -> Path:
     Resolves a user-provided path against the secure base directory
     and ensures it does not escape the sandbox.
     """
-    if base_dir is None:
-        base_dir = Path.cwd()
+    base_dir = Path.cwd() if base_dir is None else base_dir.resolve()
     
     # Normalize and resolve the path
     safe_path = (base_dir / file_path).resolve()
     
     # Check if the resolved path is within the secure base directory
-    if not str(safe_path).startswith(str(base_dir.resolve())):
+    if not safe_path.is_relative_to(base_dir):
         raise ValueError(f"Path traversal attempt detected. Access to '{file_path}' is denied.")
     
     return safe_path
@@ -112,12 +114,16 @@ def read_file(file_path: str) -> str:
         if not safe_path.is_file():
             return f"Path is not a file: {file_path}"
             
-        with open(safe_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        # One bounded binary read: a UTF-8 character is at most 4 bytes, so this
+        # covers everything the planner is shown without loading a huge file
+        byte_limit = PLANNER_MAX_FILE_CHARS * 4
+        with open(safe_path, 'rb') as f:
+            data = f.read(byte_limit + 1)
+        content = data.decode('utf-8', errors='ignore')
         
         # Limit content size for planning purposes
-        if len(content) > 10000:
-            content = content[:10000] + "\n... [Content truncated for planning analysis]"
+        if len(content) > PLANNER_MAX_FILE_CHARS or len(data) > byte_limit:
+            content = content[:PLANNER_MAX_FILE_CHARS] + "\n... [Content truncated for planning analysis]"
             
         return f"File contents of {file_path}:\n\n{content}"
     except Exception as e:
@@ -137,22 +143,26 @@ def list_directory(directory_path: str = ".") -> str:
     try:
         safe_path = _get_safe_path(directory_path)
         
-        if not safe_path.exists():
-            return f"Directory not found: {directory_path}"
-            
+        # is_dir() covers the common case in one stat; exists() only runs to word the error
         if not safe_path.is_dir():
+            if not safe_path.exists():
+                return f"Directory not found: {directory_path}"
             return f"Path is not a directory: {directory_path}"
         
+        # scandir entries carry the file type from the directory read itself,
+        # so only regular files need a stat() for their size
+        with os.scandir(safe_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
         items = []
-        for item in sorted(safe_path.iterdir()):
-            if item.is_dir():
-                items.append(f"📁 {item.name}/")
+        for entry in entries:
+            if entry.is_dir():
+                items.append(f"📁 {entry.name}/")
             else:
                 try:
-                    size = item.stat().st_size
-                    items.append(f"📄 {item.name} ({size} bytes)")
+                    size = entry.stat().st_size
+                    items.append(f"📄 {entry.name} ({size} bytes)")
                 except:
-                    items.append(f"📄 {item.name} (size unknown)")
+                    items.append(f"📄 {entry.name} (size unknown)")
         
         return f"Contents of {directory_path}:\n" + "\n".join(items) if items else f"Directory {directory_path} is empty"
     except Exception as e:
@@ -194,8 +204,27 @@ def _is_command_safe(command: str) -> tuple[bool, str]:
     
     return True, "Command is safe"
 
-@tool
-def execute_safe_bash(command: str, working_directory: str = ".") -> str:
+PLANNER_BASH_TIMEOUT_SECONDS = 30  # 30 second timeout for safety
+
+def _format_safe_bash_output(command: str, working_directory: str, returncode: int | None, stdout: str, stderr: str) -> str:
+    output = f"Command: {command}\n"
+    output += f"Exit Code: {returncode}\n"
+    output += f"Working Directory: {working_directory}\n\n"
+    
+    if stdout:
+        # Limit output size
+        if len(stdout) > 5000:
+            stdout = stdout[:5000] + "\n... [Output truncated]"
+        output += f"STDOUT:\n{stdout}\n"
+        
+    if stderr:
+        if len(stderr) > 2000:
+            stderr = stderr[:2000] + "\n... [Error output truncated]"
+        output += f"STDERR:\n{stderr}\n"
+        
+    return output
+
+def _run_safe_bash(command: str, working_directory: str = ".") -> str:
     """
     Execute safe bash commands for information gathering and analysis.
     Only whitelisted read-only commands are allowed.
@@ -226,33 +255,60 @@ def execute_safe_bash(command: str, working_directory: str = ".") -> str:
             cwd=safe_working_dir,
             capture_output=True,
             text=True,
-            timeout=30  # 30 second timeout for safety
+            timeout=PLANNER_BASH_TIMEOUT_SECONDS
         )
-        
-        output = f"Command: {command}\n"
-        output += f"Exit Code: {result.returncode}\n"
-        output += f"Working Directory: {working_directory}\n\n"
-        
-        if result.stdout:
-            # Limit output size
-            stdout = result.stdout
-            if len(stdout) > 5000:
-                stdout = stdout[:5000] + "\n... [Output truncated]"
-            output += f"STDOUT:\n{stdout}\n"
-            
-        if result.stderr:
-            stderr = result.stderr
-            if len(stderr) > 2000:
-                stderr = stderr[:2000] + "\n... [Error output truncated]"
-            output += f"STDERR:\n{stderr}\n"
-            
-        return output
+        return _format_safe_bash_output(command, working_directory, result.returncode, result.stdout, result.stderr)
         
     except subprocess.TimeoutExpired:
         return f"Command timed out (30s limit): {command}"
     except Exception as e:
         return f"Error executing command '{command}': {str(e)}"
 
+async def _arun_safe_bash(command: str, working_directory: str = ".") -> str:
+    """Async counterpart of _run_safe_bash; waits on the process without holding a thread."""
+    try:
+        # Validate command safety
+        is_safe, reason = _is_command_safe(command)
+        if not is_safe:
+            return f"Command rejected: {reason}\nCommand: {command}"
+        
+        # Ensure working directory is safe
+        safe_working_dir = _get_safe_path(working_directory)
+        
+        if not safe_working_dir.is_dir():
+            return f"Error: Working directory '{working_directory}' is not a valid directory."
+
+        proc = await asyncio.create_subprocess_shell(
+            command,
+            cwd=safe_working_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=PLANNER_BASH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return f"Command timed out (30s limit): {command}"
+
+        return _format_safe_bash_output(
+            command,
+            working_directory,
+            proc.returncode,
+            stdout.decode("utf-8", errors="replace"),
+            stderr.decode("utf-8", errors="replace")
+        )
+    except Exception as e:
+        return f"Error executing command '{command}': {str(e)}"
+
+# Sync invoke() keeps using subprocess.run; ainvoke() (used by the tool executor)
+# awaits the process instead of tying up an executor thread
+execute_safe_bash = StructuredTool.from_function(
+    func=_run_safe_bash,
+    coroutine=_arun_safe_bash,
+    name="execute_safe_bash"
+)
+
 # --- PLANNER System Prompts ---
 
 PLANNER_SYSTEM_PROMPTS = {
@@ -403,7 +459,7 @@ def get_planner_system_prompt(prompt_type: str = "comprehensive") -> str:
 
 # --- PLANNER Node Implementation ---
 
-def planner_node(state: Dict[str, Any], prompt_type: str = "comprehensive"):
+async def planner_node(state: Dict[str, Any], prompt_type: str = "comprehensive"):
     """
     PLANNER node that analyzes tasks and creates detailed execution plans.
 
@@ -420,7 +476,7 @@ def planner_node(state: Dict[str, Any], prompt_type: str = "comprehensive"):
     system_prompt = get_planner_system_prompt(prompt_type)
 
     # Create LLM client (reuse from main system)
-    model_name = os.getenv("LLM_MODEL", "openai/gpt-4o")
+    model_name = state.get("model_name") or os.getenv("LLM_MODEL", "openai/gpt-4o")
 
     try:
         from multi_agent_system import create_llm_client
@@ -428,7 +484,8 @@ def planner_node(state: Dict[str, Any], prompt_type: str = "comprehensive"):
     except ImportError:
         # Fallback if not available
         import httpx
-        http_client = httpx.Client(
+        from langchain_openai import ChatOpenAI
+        http_async_client = httpx.AsyncClient(
             verify=False,
             timeout=30.0,
             headers={
@@ -441,7 +498,7 @@ def planner_node(state: Dict[str, Any], prompt_type: str = "comprehensive"):
             base_url="https://openrouter.ai/api/v1",
             api_key=SecretStr(key) if (key := os.getenv("OPENROUTER_API_KEY")) else None,
             model=model_name,
-            http_client=http_client,
+            http_async_client=http_async_client,
             timeout=30.0,
         )
 
@@ -459,11 +516,11 @@ def planner_node(state: Dict[str, Any], prompt_type: str = "comprehensive"):
         for i, msg in enumerate(messages_for_planner):
             if hasattr(msg, 'content'):
                 content = str(msg.content)
-                logger.info(f"  Message {i+1} ({type(msg).__name__}): {content[:200]}{'...' if len(content) > 200 else ''}")
+                logger.info("  Message %d (%s): %s%s", i + 1, type(msg).__name__, content[:200], '...' if len(content) > 200 else '')
         logger.info("-------------------------------- END OF PLANNER PROMPT --------------------------------")
 
         # Get response from planner
-        response = model_with_tools.invoke(messages_for_planner)
+        response = await model_with_tools.ainvoke(messages_for_planner)
 
         response_content = str(response.content)
         debug_info = {
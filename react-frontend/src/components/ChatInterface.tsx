@@ -47,6 +47,16 @@ interface EventData {
   prompt?: { role: string; content: string }[]
   error?: string
   session_id?: string
+  // Batched events (type 'messages_batch')
+  messages?: EventData[]
+  // Token streaming fields
+  message_id?: string
+  expert?: string
+  expert_icon?: string
+  // Tool calls announced at the start of a turn (type 'tool_calls_started')
+  tool_calls?: { id: string; name: string; args?: Record<string, unknown> }[]
+  // Call a tool result event belongs to
+  tool_call_id?: string
 }
 
 interface Message {
@@ -108,6 +118,8 @@ export function ChatInterface() {
   
   const [input, setInput] = useState('')
   const [isLoading, setIsLoading] = useState(false)
+  // Tools announced by 'tool_calls_started' whose results have not arrived yet
+  const [pendingToolCalls, setPendingToolCalls] = useState<{ id: string; name: string }[]>([])
   const [activeTab, setActiveTab] = useState<'chat' | 'experts' | 'settings'>('chat')
   const [experts, setExperts] = useState<Record<string, Expert>>({})
   const [sessionId, setSessionId] = useState<string | null>(null)
@@ -211,79 +223,125 @@ export function ChatInterface() {
           message: input,
           session_id: sessionId,
           model: selectedModel,
+          batch_events: true,
         }),
         onmessage(event) {
           if (event.data) {
             try {
-              const eventData: EventData = JSON.parse(event.data)
-              console.log('📥 Received event:', eventData.type, eventData)
+              const frame: EventData = JSON.parse(event.data)
+              console.log('📥 Received event:', frame.type, frame)
 
-              if (eventData.session_id && !sessionId) {
-                setSessionId(eventData.session_id)
+              if (frame.session_id && !sessionId) {
+                setSessionId(frame.session_id)
               }
-              
-              if (eventData.type === 'message' && eventData.message) {
-                const newMessage: Message = {
-                  id: eventData.message.id,
-                  type: eventData.message.type,
-                  content: eventData.message.content,
-                  expert: eventData.message.expert,
-                  expert_icon: eventData.message.expert_icon,
-                  timestamp: new Date(eventData.message.timestamp),
-                  tool_name: eventData.message.tool_name,
-                  tool_args: eventData.message.tool_args,
-                  prompt: eventData.message.prompt as unknown as {role:string;content:string}[]
-                }
-                setMessages(prev => [...prev, newMessage])
-              } else if (eventData.type === 'file_operation') {
-                const fileOperationMessage: Message = {
-                  id: uuidv4(),
-                  type: 'file_operation',
-                  content: eventData.content || '',
-                  timestamp: new Date(eventData.timestamp || new Date().toISOString()),
-                  operation: eventData.operation,
-                  file_path: eventData.file_path,
-                  success: eventData.success,
-                  before_content: eventData.before_content,
-                  after_content: eventData.after_content,
-                  diff: eventData.diff,
-                  prompt: eventData.prompt,
-                  tool_args: eventData.tool_args,
-                }
-                setMessages(prev => [...prev, fileOperationMessage])
-              } else if (eventData.type === 'terminal') {
-                const terminalMessage: Message = {
-                  id: uuidv4(),
-                  type: 'terminal',
-                  content: eventData.result || '',
-                  timestamp: new Date(eventData.timestamp || new Date().toISOString()),
-                  tool_name: eventData.tool_name,
-                  command: eventData.command,
-                  result: eventData.result,
-                  success: eventData.success,
-                  tool_args: eventData.tool_args,
-                  prompt: eventData.prompt as unknown as {role:string;content:string}[]
+
+              // A batch frame carries the events of a multi-tool turn in one SSE message
+              const events = frame.type === 'messages_batch' ? frame.messages ?? [] : [frame]
+              for (const eventData of events) {
+                const finishedCallId = eventData.tool_call_id
+                if (finishedCallId) {
+                  setPendingToolCalls(prev => prev.filter(call => call.id !== finishedCallId))
+                } else if (eventData.type === 'token' || eventData.type === 'message') {
+                  // The expert is answering again, so the previous batch is done
+                  setPendingToolCalls(prev => (prev.length ? [] : prev))
                 }
-                setMessages(prev => [...prev, terminalMessage])
-              } else if (eventData.type === 'tool_call') {
-                // Generic tool call event (for tools that don't have specific UI)
-                const toolCallMessage: Message = {
-                  id: uuidv4(),
-                  type: 'tool_call',
-                  content: eventData.result || '',
-                  timestamp: new Date(eventData.timestamp || new Date().toISOString()),
-                  tool_name: eventData.tool_name,
-                  command: eventData.command,
-                  result: eventData.result,
-                  success: eventData.success,
-                  tool_args: eventData.tool_args,
-                  prompt: eventData.prompt as unknown as {role:string;content:string}[]
+
+                if (eventData.type === 'tool_calls_started') {
+                  setPendingToolCalls((eventData.tool_calls ?? []).map(call => ({ id: call.id, name: call.name })))
+                } else if (eventData.type === 'message' && eventData.message) {
+                  const newMessage: Message = {
+                    id: eventData.message.id,
+                    type: eventData.message.type,
+                    content: eventData.message.content,
+                    expert: eventData.message.expert,
+                    expert_icon: eventData.message.expert_icon,
+                    timestamp: new Date(eventData.message.timestamp),
+                    tool_name: eventData.message.tool_name,
+                    tool_args: eventData.message.tool_args,
+                    prompt: eventData.message.prompt as unknown as {role:string;content:string}[]
+                  }
+                  // Replace the streamed draft with the same id, if there is one
+                  setMessages(prev => {
+                    const index = prev.findIndex(m => m.id === newMessage.id)
+                    if (index === -1) return [...prev, newMessage]
+                    const next = [...prev]
+                    next[index] = newMessage
+                    return next
+                  })
+                } else if (eventData.type === 'token' && eventData.message_id) {
+                  // Append streamed tokens to a draft agent message
+                  const draftId = eventData.message_id
+                  const delta = eventData.content || ''
+                  setMessages(prev => {
+                    const index = prev.findIndex(m => m.id === draftId)
+                    if (index === -1) {
+                      return [...prev, {
+                        id: draftId,
+                        type: 'agent',
+                        content: delta,
+                        expert: eventData.expert,
+                        expert_icon: eventData.expert_icon,
+                        timestamp: new Date(),
+                      }]
+                    }
+                    const next = [...prev]
+                    next[index] = { ...next[index], content: next[index].content + delta }
+                    return next
+                  })
+                } else if (eventData.type === 'file_operation') {
+                  const fileOperationMessage: Message = {
+                    id: uuidv4(),
+                    type: 'file_operation',
+                    content: eventData.content || '',
+                    timestamp: new Date(eventData.timestamp || new Date().toISOString()),
+                    operation: eventData.operation,
+                    file_path: eventData.file_path,
+                    success: eventData.success,
+                    before_content: eventData.before_content,
+                    after_content: eventData.after_content,
+                    diff: eventData.diff,
+                    prompt: eventData.prompt,
+                    tool_args: eventData.tool_args,
+                  }
+                  setMessages(prev => [...prev, fileOperationMessage])
+                } else if (eventData.type === 'terminal') {
+                  const terminalMessage: Message = {
+                    id: uuidv4(),
+                    type: 'terminal',
+                    content: eventData.result || '',
+                    timestamp: new Date(eventData.timestamp || new Date().toISOString()),
+                    tool_name: eventData.tool_name,
+                    command: eventData.command,
+                    result: eventData.result,
+                    success: eventData.success,
+                    tool_args: eventData.tool_args,
+                    prompt: eventData.prompt as unknown as {role:string;content:string}[]
+                  }
+                  setMessages(prev => [...prev, terminalMessage])
+                } else if (eventData.type === 'tool_call') {
+                  // Generic tool call event (for tools that don't have specific UI)
+                  const toolCallMessage: Message = {
+                    id: uuidv4(),
+                    type: 'tool_call',
+                    content: eventData.result || '',
+                    timestamp: new Date(eventData.timestamp || new Date().toISOString()),
+                    tool_name: eventData.tool_name,
+                    command: eventData.command,
+                    result: eventData.result,
+                    success: eventData.success,
+                    tool_args: eventData.tool_args,
+                    prompt: eventData.prompt as unknown as {role:string;content:string}[]
+                  }
+                  setMessages(prev => [...prev, toolCallMessage])
+                } else if (eventData.type === 'error') {
+                  throw new Error(eventData.error)
+                } else if (eventData.type === 'complete' || eventData.type === 'end') {
+                  // Calls that produced no displayable event are not pending anymore either
+                  setPendingToolCalls([])
+                  if (eventData.type === 'end') {
+                    setIsLoading(false)
+                  }
                 }
-                setMessages(prev => [...prev, toolCallMessage])
-              } else if (eventData.type === 'error') {
-                throw new Error(eventData.error)
-              } else if (eventData.type === 'end') {
-                setIsLoading(false)
               }
             } catch (parseError) {
               console.warn('Failed to parse SSE data:', event.data, parseError)
@@ -292,6 +350,7 @@ export function ChatInterface() {
         },
         onclose() {
           console.log('Connection closed by the server.')
+          setPendingToolCalls([])
           setIsLoading(false)
         },
         onerror(err) {
@@ -305,6 +364,7 @@ export function ChatInterface() {
             timestamp: new Date(),
           }
           setMessages(prev => [...prev, errorMessage])
+          setPendingToolCalls([])
           setIsLoading(false)
           throw err // Stop retries
         },
@@ -639,7 +699,11 @@ export function ChatInterface() {
                     <div className="w-2 h-2 bg-muted-foreground rounded-full animate-bounce" style={{ animationDelay: '0.1s' }} />
                     <div className="w-2 h-2 bg-muted-foreground rounded-full animate-bounce" style={{ animationDelay: '0.2s' }} />
                   </div>
-                  <span className="text-sm text-muted-foreground">Expert is working...</span>
+                  <span className="text-sm text-muted-foreground">
+                    {pendingToolCalls.length > 0
+                      ? `Running ${pendingToolCalls.map(call => call.name).join(', ')}...`
+                      : 'Expert is working...'}
+                  </span>
                 </div>
               </div>
             </motion.div>
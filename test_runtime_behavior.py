@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Offline checks for the agent runtime (no API key or network needed)
+
+Covers behavior that does not depend on what an LLM decides to do:
+1. Tool execution order: concurrent edits to one file, write-then-run turns
+2. Tool result cache invalidation after mutating tools
+3. LLM response cache and routing shortcuts
+4. Sandbox path checks of the expert and PLANNER tools
+5. Stopping the expert loop on back-to-back repeated turns
+6. Session LRU/TTL eviction, history budget, SSE and NDJSON framing in the API server
+"""
+
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+def _tool_turn(tool_calls, parallel=True):
+    """State for one tool_executor_node run over the given tool calls."""
+    from langchain_core.messages import AIMessage, HumanMessage
+    return {
+        "messages": [HumanMessage(content="test"), AIMessage(content="", tool_calls=tool_calls)],
+        "tool_call_count": 0,
+        "tool_call_history": [],
+        "tool_failures": {},
+        "recent_files": [],
+        "file_operation_events": [],
+        "terminal_events": [],
+        "parallel_tool_calls": parallel,
+    }
+
+class _ScriptedModel:
+    """Stands in for the chat model: replays a fixed list of responses."""
+    temperature = 0
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = 0
+        # Message lists the model was called with, one per call
+        self.prompts = []
+
+    def bind_tools(self, tools):
+        return self
+
+    def _next(self):
+        response = self.responses[min(self.calls, len(self.responses) - 1)]
+        self.calls += 1
+        return response
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages)
+        return self._next()
+
+    async def astream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+        self.prompts.append(messages)
+        response = self._next()
+        if response.content:
+            yield AIMessageChunk(content=response.content)
+        if response.tool_calls:
+            yield AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(response.tool_calls)
+            ])
+
+def _use_scripted_model(system, responses):
+    model = _ScriptedModel(responses)
+    system.create_llm_client = lambda model_name: model
+    system._bound_model.cache_clear()
+    return model
+
+def test_concurrent_edits():
+    """Several edits of one file in a single turn must all land"""
+    print("🔀 Testing concurrent tool calls")
+    print("=" * 50)
+
+    import multi_agent_system as system
+
+    # Large enough that overlapping read-modify-write cycles lost edits
+    body = "".join(f"value_{i} = {i}\n" for i in range(200000))
+    markers = ["ALPHA", "BRAVO", "CHARLIE", "DELTA"]
+
+    lost_runs = 0
+    for run in range(5):
+        system.write_file.invoke({"file_path": "concurrent_edits.py", "content": body + "\n".join(markers) + "\n"})
+        calls = [
+            {"id": f"edit_{i}", "name": "find_and_replace_in_file",
+             "args": {"file_path": "concurrent_edits.py", "find_text": marker, "replace_text": marker.lower()}}
+            for i, marker in enumerate(markers)
+        ]
+        asyncio.run(system.tool_executor_node(_tool_turn(calls)))
+        tail = system.read_file.invoke({"file_path": "concurrent_edits.py"})[-40:]
+        if not all(marker.lower() in tail for marker in markers):
+            lost_runs += 1
+    print(f"Runs with lost edits: {lost_runs}/5")
+
+    # A command must see the file written by an earlier call of the same turn
+    calls = [
+        {"id": "write", "name": "write_file", "args": {"file_path": "written_then_run.txt", "content": "ready\n"}},
+        {"id": "run", "name": "execute_bash_command", "args": {"command": "cat written_then_run.txt"}},
+    ]
+    result = asyncio.run(system.tool_executor_node(_tool_turn(calls)))
+    command_saw_file = "ready" in str(result["messages"][1].content)
+    print(f"Command saw the file written before it: {command_saw_file}")
+
+    # Results still come back in call order
+    in_order = [m.tool_call_id for m in result["messages"]] == ["write", "run"]
+
+    return lost_runs == 0 and command_saw_file and in_order
+
+def test_tool_result_cache():
+    """read_file results are reused until a mutating tool runs"""
+    print("\n💾 Testing tool result cache invalidation")
+    print("=" * 50)
+
+    import multi_agent_system as system
+
+    if system._tool_result_cache is None:
+        print("⚠️  Tool result cache disabled (TOOL_RESULT_CACHE_TTL_SECONDS=0), skipping")
+        return True
+
+    results = {}
+    system.write_file.invoke({"file_path": "cached_read.txt", "content": "first\n"})
+    read_call = {"id": "read", "name": "read_file", "args": {"file_path": "cached_read.txt"}}
+
+    def read_back():
+        turn = asyncio.run(system.tool_executor_node(_tool_turn([dict(read_call)])))
+        return str(turn["messages"][0].content)
+
+    results["first_read"] = "first" in read_back()
+
+    # Changing the file behind the tools' back is not seen: the result is cached
+    Path(system._get_safe_path("cached_read.txt")).write_text("outside\n")
+    results["served_from_cache"] = "first" in read_back()
+
+    # An edit through the tools clears the cache, including for a read in the same turn
+    turn = asyncio.run(system.tool_executor_node(_tool_turn([
+        {"id": "edit", "name": "find_and_replace_in_file",
+         "args": {"file_path": "cached_read.txt", "find_text": "outside", "replace_text": "edited"}},
+        dict(read_call),
+    ])))
+    results["read_after_edit"] = "edited" in str(turn["messages"][1].content)
+
+    # So does a shell command, which may change any file
+    asyncio.run(system.tool_executor_node(_tool_turn([
+        {"id": "shell", "name": "execute_bash_command", "args": {"command": "echo shell > cached_read.txt"}},
+    ])))
+    results["read_after_shell"] = "shell" in read_back()
+
+    # A read that overlapped a mutation is not stored
+    cache = system.ToolResultCache(ttl=30)
+    started = cache.epoch
+    cache.begin_mutation()
+    cache.set("key", "stale", started)
+    cache.end_mutation()
+    results["overlapping_read_not_cached"] = cache.get("key") is None
+
+    for name, passed in results.items():
+        print(f"  {name}: {'✅' if passed else '❌'}")
+    return all(results.values())
+
+def test_response_caches():
+    """LLM response cache LRU/TTL and the routing shortcuts"""
+    print("\n🧠 Testing response caches and routing shortcuts")
+    print("=" * 50)
+
+    import multi_agent_system as system
+    from langchain_core.messages import AIMessage
+
+    results = {}
+
+    cache = system.LLMCache(maxsize=2, ttl=30)
+    cache.set("a", AIMessage(content="A"))
+    cache.set("b", AIMessage(content="B"))
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", AIMessage(content="C"))
+    results["llm_cache_lru"] = cache.get("b") is None and cache.get("a").content == "A"
+    results["llm_cache_copies"] = cache.get("a") is not cache.get("a")
+
+    cache = system.LLMCache(maxsize=2, ttl=0.05)
+    cache.set("a", AIMessage(content="A"))
+    time.sleep(0.1)
+    results["llm_cache_ttl"] = cache.get("a") is None
+
+    route = lambda query: system._route_by_keywords(system._normalize_query(query))
+    results["route_review"] = route("Please review utils.py") == "CodeReviewer"
+    results["route_write"] = route("Write a binary search in Python") == "CodeGenerator"
+    # Fix requests are not review requests; they go to the routing LLM
+    results["route_fix_bug_to_llm"] = route("Fix the bug in utils.py") is None
+    results["route_tie_to_llm"] = route("Create a plan") is None
+
+    system._cache_route("test-model", "some query", "Planner")
+    results["routing_cache_hit"] = system._get_cached_route("test-model", "some query") == "Planner"
+    results["routing_cache_per_model"] = system._get_cached_route("other-model", "some query") is None
+
+    for name, passed in results.items():
+        print(f"  {name}: {'✅' if passed else '❌'}")
+    return all(results.values())
+
+def test_sandbox_paths():
+    """Paths outside the sandbox are refused, also once a checked directory becomes a symlink"""
+    print("\n🔒 Testing sandbox path checks")
+    print("=" * 50)
+
+    import multi_agent_system as system
+    import planner_node
+
+    results = {}
+
+    def refused(resolve, path):
+        try:
+            resolve(path)
+        except ValueError:
+            return True
+        return False
+
+    system._get_safe_path("inside.txt")
+    results["expert_parent_refused"] = refused(system._get_safe_path, "../outside.txt")
+    results["expert_absolute_refused"] = refused(system._get_safe_path, "/etc/passwd")
+    results["expert_read_refused"] = "denied" in system.read_file.invoke({"file_path": "../../etc/passwd"}).lower()
+
+    # A directory that passed the check once is swapped for a symlink leaving the sandbox
+    import shutil
+    import tempfile
+    swapped = system._secure_base_dir / "swapped_dir"
+    swapped.mkdir(exist_ok=True)
+    system._get_safe_path("swapped_dir/file.txt")
+    with tempfile.TemporaryDirectory() as outside:
+        swapped.rmdir()
+        swapped.symlink_to(outside, target_is_directory=True)
+        try:
+            results["expert_swapped_symlink_refused"] = refused(system._get_safe_path, "swapped_dir/file.txt")
+        finally:
+            swapped.unlink()
+
+    results["planner_parent_refused"] = refused(planner_node._get_safe_path, "../outside.txt")
+    results["planner_read_refused"] = "denied" in planner_node.read_file.invoke({"file_path": "../../etc/passwd"}).lower()
+
+    for name, passed in results.items():
+        print(f"  {name}: {'✅' if passed else '❌'}")
+    return all(results.values())
+
+def test_repeated_turns():
+    """Only a turn identical to the one right before it stops the expert loop"""
+    print("\n🔁 Testing repeated tool-calling turns")
+    print("=" * 50)
+
+    import multi_agent_system as system
+    from langchain_core.messages import AIMessage
+
+    def listing(call_id):
+        return AIMessage(content="", tool_calls=[{"id": call_id, "name": "list_directory", "args": {}}])
+
+    def reading(call_id):
+        return AIMessage(content="", tool_calls=[{"id": call_id, "name": "read_file", "args": {"file_path": "repeat.txt"}}])
+
+    def final_answer(responses):
+        _use_scripted_model(system, responses)
+
+        async def collect():
+            query = [{"type": "human", "content": "write a small script"}]
+            return [event async for event in system.run_multi_agent_query_stream_async(query)]
+
+        agent_messages = [
+            event["message"]["content"] for event in asyncio.run(collect())
+            if event["type"] == "message" and event["message"]["type"] == "agent"
+        ]
+        return agent_messages[-1]
+
+    system.write_file.invoke({"file_path": "repeat.txt", "content": "repeat\n"})
+    results = {}
+    # A, B, A is an ordinary check -> change -> re-check loop
+    results["a_b_a_completes"] = final_answer([listing("a1"), reading("b1"), listing("a2"), AIMessage(content="Done.")]) == "Done."
+    # A, A makes no progress
+    results["a_a_stops"] = final_answer([listing("a1"), listing("a2"), AIMessage(content="Done.")]).startswith("⚠️ Stopped early")
+
+    for name, passed in results.items():
+        print(f"  {name}: {'✅' if passed else '❌'}")
+    return all(results.values())
+
+def test_api_server():
+    """Session eviction and SSE framing of a streamed tool turn"""
+    print("\n📡 Testing API server sessions and streaming")
+    print("=" * 50)
+
+    import api_server
+    import multi_agent_system as system
+    from fastapi.testclient import TestClient
+    from langchain_core.messages import AIMessage
+
+    results = {}
+
+    # LRU: the least recently used session goes first
+    saved_limit = api_server.MAX_SESSIONS
+    api_server.sessions.clear()
+    api_server.MAX_SESSIONS = 2
+    try:
+        first = api_server.get_or_create_session()
+        second = api_server.get_or_create_session()
+        api_server.get_or_create_session(first.session_id)
+        api_server.get_or_create_session()
+        results["session_lru"] = first.session_id in api_server.sessions and second.session_id not in api_server.sessions
+
+        # TTL: idle sessions are swept and not handed out again
+        first.last_activity -= api_server.SESSION_TTL_SECONDS + 1
+        results["session_ttl_sweep"] = api_server.evict_expired_sessions() == 1
+        results["session_ttl_lookup"] = api_server.get_or_create_session(first.session_id).session_id != first.session_id
+    finally:
+        api_server.MAX_SESSIONS = saved_limit
+        api_server.sessions.clear()
+
+    # One tool-calling turn with text before the calls, then a final answer
+    system.write_file.invoke({"file_path": "streamed.txt", "content": "streamed\n"})
+    _use_scripted_model(system, [
+        AIMessage(content="Let me look around first.", tool_calls=[
+            {"id": "list", "name": "list_directory", "args": {}},
+            {"id": "read", "name": "read_file", "args": {"file_path": "streamed.txt"}},
+        ]),
+        AIMessage(content="All done."),
+    ])
+    with TestClient(api_server.app) as client:
+        response = client.post("/chat/stream", json={"message": "write a file", "batch_events": True})
+    frames = [line for line in response.text.split("\n\n") if line]
+    results["sse_frames_well_formed"] = all(frame.startswith("data: {") for frame in frames)
+    events = [json.loads(frame[len("data: "):]) for frame in frames]
+    results["sse_session_id_on_every_frame"] = all(event.get("session_id") for event in events)
+    results["sse_ends_with_end"] = events[-1]["type"] == "end"
+
+    flat = []
+    for event in events:
+        flat.extend(event["messages"] if event["type"] == "messages_batch" else [event])
+    results["sse_every_tool_result_sent"] = sum(event["type"] == "tool_call" for event in flat) == 2
+
+    # Text streamed before the tool calls is finalized under the same id
+    token_ids = {event["message_id"] for event in flat if event["type"] == "token"}
+    message_ids = {event["message"]["id"] for event in flat if event["type"] == "message"}
+    results["sse_drafts_finalized"] = bool(token_ids) and token_ids <= message_ids
+
+    # The NDJSON endpoint streams the same events, one per line, and saves the session too
+    _use_scripted_model(system, [AIMessage(content="Written.")])
+    with TestClient(api_server.app) as client:
+        response = client.post("/chat/ndjson", json={"message": "write a file"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results["ndjson_media_type"] = response.headers["content-type"].startswith("application/x-ndjson")
+    results["ndjson_ends_with_end"] = bool(lines) and lines[-1]["type"] == "end"
+    session_id = lines[-1]["session_id"] if lines else None
+    results["ndjson_session_id_on_every_line"] = all(line.get("session_id") == session_id for line in lines)
+    saved = api_server.sessions[session_id].messages if session_id in api_server.sessions else []
+    results["ndjson_session_saved"] = [m.type for m in saved] == ["human", "ai"] and saved[1].content == "Written."
+
+    # Earlier turns of a real saved session are trimmed to the history budget
+    saved_budget = system.HISTORY_TOKEN_BUDGET
+    system.HISTORY_TOKEN_BUDGET = 2000
+    try:
+        model = _use_scripted_model(system, [AIMessage(content="A long answer. " * 400)])
+        with TestClient(api_server.app) as client:
+            session_id = None
+            for query in ["write the first module", "write the second module", "write the third module"]:
+                response = client.post("/chat/stream", json={"message": query, "session_id": session_id})
+                session_id = json.loads(response.text.split("\n\n")[0][len("data: "):])["session_id"]
+        saved = api_server.sessions[session_id].messages
+        prompt_texts = [str(m.content) for m in model.prompts[-1]]
+        results["history_saved_in_full"] = len(saved) == 6
+        results["history_oldest_turn_dropped"] = "write the first module" not in prompt_texts
+        results["history_latest_turns_kept"] = prompt_texts.count("write the third module") == 1 and "write the second module" in prompt_texts
+    finally:
+        system.HISTORY_TOKEN_BUDGET = saved_budget
+        api_server.sessions.clear()
+
+    for name, passed in results.items():
+        print(f"  {name}: {'✅' if passed else '❌'}")
+    return all(results.values())
+
+def main():
+    """Run the offline runtime checks"""
+    print("🚀 Runtime Behavior Test Suite")
+    print("=" * 60)
+
+    tests = [
+        ("Concurrent Tool Calls", test_concurrent_edits),
+        ("Tool Result Cache", test_tool_result_cache),
+        ("Response Caches", test_response_caches),
+        ("Sandbox Paths", test_sandbox_paths),
+        ("Repeated Turns", test_repeated_turns),
+        ("API Server", test_api_server),
+    ]
+
+    results = {}
+    for test_name, test_func in tests:
+        print(f"\n🧪 Running {test_name} tests...")
+        try:
+            results[test_name] = test_func()
+        except Exception as e:
+            print(f"❌ {test_name} test failed with exception: {e}")
+            results[test_name] = False
+
+    # Summary
+    print("\n📊 Test Results Summary")
+    print("=" * 30)
+    for test_name, passed in results.items():
+        status = "✅ PASSED" if passed else "❌ FAILED"
+        print(f"{test_name}: {status}")
+
+    passed_tests = sum(results.values())
+    print(f"\nOverall: {passed_tests}/{len(results)} tests passed")
+    return 0 if passed_tests == len(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())